@@ -2,7 +2,7 @@
 
 {
     'name': 'WhatsApp Integration',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.1.0',
     'category': 'Productivity/Discuss',
     'sequence': 146,
     'summary': 'WhatsApp Web API Integration for Odoo',
@@ -72,6 +72,7 @@ Technical Implementation:
         
         # 'data/whatsapp_data.xml',
         # 'data/ir_cron_data.xml',
+        'data/ir_cron_queue_data.xml',
         
         'views/whatsapp_account_views.xml',
         'views/whatsapp_message_views.xml',
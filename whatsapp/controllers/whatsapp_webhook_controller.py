@@ -3,7 +3,6 @@
 from odoo import http, fields, _
 from odoo.exceptions import AccessError, UserError
 from odoo.http import request
-import json
 import logging
 import hmac
 import hashlib
@@ -96,7 +95,7 @@ class WhatsAppWebhookController(http.Controller):
                 'to_number': message_data.get('to', '').replace('@c.us', ''),
                 'timestamp': fields.Datetime.now(),
                 'status': 'delivered',
-                'raw_data': json.dumps(webhook_data),
+                'raw_data': webhook_data,
             }
             
             # Handle group messages
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def _column_type(cr, table, column):
+    cr.execute("""
+        SELECT data_type FROM information_schema.columns
+         WHERE table_name = %s AND column_name = %s
+    """, [table, column])
+    row = cr.fetchone()
+    return row and row[0]
+
+
+def _migrate_template_variables(cr):
+    """Convert whatsapp_template.variables from JSON text to jsonb"""
+    if _column_type(cr, 'whatsapp_template', 'variables') != 'text':
+        return
+
+    # Blank out values that are not valid JSON so the cast below cannot fail
+    cr.execute("SELECT id, variables FROM whatsapp_template WHERE variables IS NOT NULL")
+    invalid_ids = []
+    for template_id, value in cr.fetchall():
+        try:
+            json.loads(value)
+        except ValueError:
+            invalid_ids.append(template_id)
+    if invalid_ids:
+        _logger.warning('Dropping invalid variables JSON on templates %s', invalid_ids)
+        cr.execute("UPDATE whatsapp_template SET variables = NULL WHERE id = ANY(%s)", [invalid_ids])
+
+    cr.execute("ALTER TABLE whatsapp_template ALTER COLUMN variables TYPE jsonb USING variables::jsonb")
+
+
+def _migrate_webhook_events(cr):
+    """Convert whatsapp_webhook.events from a comma-separated string to a jsonb array"""
+    if _column_type(cr, 'whatsapp_webhook', 'events') != 'character varying':
+        return
+
+    cr.execute(r"""
+        ALTER TABLE whatsapp_webhook ALTER COLUMN events TYPE jsonb USING (
+            CASE WHEN trim(COALESCE(events, '')) = '' THEN NULL
+                 ELSE to_jsonb(regexp_split_to_array(trim(events), '\s*,\s*'))
+            END
+        )
+    """)
+
+
+def migrate(cr, version):
+    _migrate_template_variables(cr)
+    _migrate_webhook_events(cr)
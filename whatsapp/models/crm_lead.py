@@ -67,6 +67,11 @@ class CrmLead(models.Model):
             else:
                 lead.whatsapp_last_message_date = False
 
+    @api.model
+    def _get_whatsapp_source_id(self):
+        """Return the id of the WhatsApp lead source, from the cached XML id lookup"""
+        return self.env['ir.model.data']._xmlid_to_res_id('whatsapp.lead_source_whatsapp')
+
     @api.model
     def create(self, vals):
         """Override create to handle WhatsApp-specific logic"""
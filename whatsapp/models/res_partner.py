@@ -34,13 +34,19 @@ class ResPartner(models.Model):
 
     @api.depends('whatsapp_contact_ids')
     def _compute_whatsapp_contact_count(self):
+        contact_counts = dict(self.env['whatsapp.contact']._read_group(
+            [('partner_id', 'in', self.ids)], ['partner_id'], ['__count']
+        ))
         for partner in self:
-            partner.whatsapp_contact_count = len(partner.whatsapp_contact_ids)
+            partner.whatsapp_contact_count = contact_counts.get(partner, 0)
 
     @api.depends('whatsapp_message_ids')
     def _compute_whatsapp_message_count(self):
+        message_counts = dict(self.env['whatsapp.message']._read_group(
+            [('partner_id', 'in', self.ids)], ['partner_id'], ['__count']
+        ))
         for partner in self:
-            partner.whatsapp_message_count = len(partner.whatsapp_message_ids)
+            partner.whatsapp_message_count = message_counts.get(partner, 0)
 
     def action_send_whatsapp_message(self):
         """Send WhatsApp message to partner"""
@@ -2,7 +2,7 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
-from odoo.tools import ustr
+from odoo.tools import split_every, ustr
 import json
 import logging
 import requests
@@ -14,6 +14,13 @@ from datetime import datetime, timedelta
 
 _logger = logging.getLogger(__name__)
 
+# Number of messages sent per request to the gateway bulk endpoint
+BULK_SEND_BATCH_SIZE = 50
+
+# Timeout of a bulk request in seconds, on top of the delays between its messages
+BULK_SEND_TIMEOUT = 10
+BULK_SEND_MESSAGE_TIMEOUT = 5
+
 
 class WhatsAppAccount(models.Model):
     _name = 'whatsapp.account'
@@ -99,13 +106,19 @@ class WhatsAppAccount(models.Model):
 
     @api.depends('contact_ids')
     def _compute_contacts_count(self):
+        contact_counts = dict(self.env['whatsapp.contact']._read_group(
+            [('account_id', 'in', self.ids)], ['account_id'], ['__count']
+        ))
         for record in self:
-            record.contacts_count = len(record.contact_ids)
+            record.contacts_count = contact_counts.get(record, 0)
 
     @api.depends('group_ids')
     def _compute_groups_count(self):
+        group_counts = dict(self.env['whatsapp.group']._read_group(
+            [('account_id', 'in', self.ids)], ['account_id'], ['__count']
+        ))
         for record in self:
-            record.groups_count = len(record.group_ids)
+            record.groups_count = group_counts.get(record, 0)
 
     @api.model
     def create(self, vals):
@@ -320,6 +333,101 @@ class WhatsAppAccount(models.Model):
             _logger.error(f'Error sending message: {e}')
             raise UserError(_('Error sending message: %s') % str(e))
 
+    def send_messages_bulk(self, messages, message_type='text', attachment=None, delay=0):
+        """Send several messages via WhatsApp, in batches of one API call each
+
+        The gateway bulk endpoint only sends text; other message types are
+        sent one message at a time.
+
+        :param messages: list of (to, message) pairs
+        :param delay: seconds to wait between two messages
+        :return: for each message in order, the error returned by the gateway,
+                 or False when it was sent
+        """
+        self.ensure_one()
+
+        if self.status != 'ready':
+            raise UserError(_('WhatsApp account is not ready to send messages.'))
+
+        if message_type != 'text':
+            return self._send_messages_one_by_one(messages, message_type, attachment, delay)
+
+        errors = []
+        message_vals_list = []
+        now = fields.Datetime.now()
+        for batch in split_every(BULK_SEND_BATCH_SIZE, messages, list):
+            # The gateway only waits between the messages of a single request
+            if errors and delay:
+                time.sleep(delay)
+
+            error = False
+            try:
+                response = requests.post(
+                    f'{self.api_endpoint}/send/bulk',
+                    json={
+                        'session': self.session_name,
+                        'type': message_type,
+                        'delay': delay,
+                        'messages': [{'to': to, 'message': message} for to, message in batch],
+                    },
+                    headers={'Authorization': f'Bearer {self.api_key}'},
+                    timeout=BULK_SEND_TIMEOUT + len(batch) * (delay + BULK_SEND_MESSAGE_TIMEOUT),
+                )
+                if response.status_code != 200:
+                    error = _('Failed to send messages: %s') % response.text
+            except requests.exceptions.RequestException as e:
+                error = _('Failed to send messages: %s') % e
+
+            if error:
+                # Stop at the first failed request, the remaining messages are not sent
+                _logger.error('Bulk send of account %s stopped: %s', self.name, error)
+                errors += [error] * (len(messages) - len(errors))
+                break
+
+            results = response.json().get('results', [])
+            for index, (to, message) in enumerate(batch):
+                result = results[index] if index < len(results) else {'error': 'No result returned'}
+                if result.get('error'):
+                    errors.append(result['error'])
+                    continue
+
+                errors.append(False)
+                message_vals_list.append({
+                    'account_id': self.id,
+                    'message_id': result.get('message_id'),
+                    'to_number': to,
+                    'message': message,
+                    'message_type': message_type,
+                    'direction': 'outgoing',
+                    'status': 'sent',
+                    'sent_date': now,
+                })
+
+        # Create message records of all sent messages at once
+        self.env['whatsapp.message'].create(message_vals_list)
+
+        # Update statistics
+        self.messages_sent += len(message_vals_list)
+
+        return errors
+
+    def _send_messages_one_by_one(self, messages, message_type, attachment, delay):
+        """Send media messages through the single message endpoint
+
+        :return: the errors of the messages, as send_messages_bulk
+        """
+        errors = []
+        for to, message in messages:
+            if errors and delay:
+                time.sleep(delay)
+            try:
+                self.send_message(to, message, message_type=message_type, attachment=attachment)
+            except UserError as e:
+                errors.append(str(e))
+            else:
+                errors.append(False)
+        return errors
+
     def sync_contacts(self):
         """Sync contacts from WhatsApp"""
         self.ensure_one()
@@ -336,8 +444,11 @@ class WhatsAppAccount(models.Model):
             if response.status_code == 200:
                 contacts_data = response.json()
                 
-                for contact_data in contacts_data.get('contacts', []):
-                    self._sync_contact(contact_data)
+                contact_vals_list = [
+                    self._prepare_contact_vals(contact_data)
+                    for contact_data in contacts_data.get('contacts', [])
+                ]
+                self.env['whatsapp.contact']._upsert_contacts(self.id, contact_vals_list)
                 
                 return True
             else:
@@ -347,20 +458,14 @@ class WhatsAppAccount(models.Model):
             _logger.error(f'Error syncing contacts: {e}')
             raise UserError(_('Error syncing contacts: %s') % str(e))
 
-    def _sync_contact(self, contact_data):
-        """Sync individual contact"""
+    def _prepare_contact_vals(self, contact_data):
+        """Prepare contact values from WhatsApp contact data"""
         self.ensure_one()
         
         phone_number = contact_data.get('id', '').replace('@c.us', '')
         name = contact_data.get('name') or contact_data.get('pushname') or phone_number
         
-        # Check if contact already exists
-        existing_contact = self.env['whatsapp.contact'].search([
-            ('account_id', '=', self.id),
-            ('phone_number', '=', phone_number)
-        ], limit=1)
-        
-        contact_vals = {
+        return {
             'account_id': self.id,
             'name': name,
             'phone_number': phone_number,
@@ -369,11 +474,37 @@ class WhatsAppAccount(models.Model):
             'is_group': contact_data.get('isGroup', False),
             'last_seen': fields.Datetime.now(),
         }
+
+    def _sync_contact(self, contact_data):
+        """Sync individual contact"""
+        self.ensure_one()
+        
+        contact_vals = self._prepare_contact_vals(contact_data)
+        return self.env['whatsapp.contact']._upsert_contacts(self.id, [contact_vals])
+
+    def _send_read_receipt(self, wa_message_ids):
+        """Send read receipts for one or several messages in one API call"""
+        self.ensure_one()
         
-        if existing_contact:
-            existing_contact.write(contact_vals)
-        else:
-            self.env['whatsapp.contact'].create(contact_vals)
+        if isinstance(wa_message_ids, str):
+            wa_message_ids = [wa_message_ids]
+        wa_message_ids = [wa_message_id for wa_message_id in wa_message_ids if wa_message_id]
+        if not wa_message_ids:
+            return True
+        
+        response = requests.post(
+            f'{self.api_endpoint}/messages/read',
+            json={
+                'session': self.session_name,
+                'message_ids': wa_message_ids,
+            },
+            headers={'Authorization': f'Bearer {self.api_key}'}
+        )
+        
+        if response.status_code != 200:
+            raise UserError(_('Failed to send read receipts: %s') % response.text)
+        
+        return True
 
     def action_open_dashboard(self):
         """Open WhatsApp dashboard"""
@@ -2,7 +2,9 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import create_index
 import logging
+from collections import defaultdict
 
 _logger = logging.getLogger(__name__)
 
@@ -77,35 +79,43 @@ class WhatsAppContact(models.Model):
         ('unique_phone_account', 'unique(phone_number, account_id)', 'Phone number must be unique per account!'),
     ]
 
+    def init(self):
+        # Account-first index for the per-account lookups done by sync and counters
+        create_index(self._cr, 'whatsapp_contact_account_phone_idx', self._table, ['account_id', 'phone_number'])
+
     @api.depends('message_ids')
     def _compute_message_count(self):
+        message_counts = dict(self.env['whatsapp.message']._read_group(
+            [('contact_id', 'in', self.ids)], ['contact_id'], ['__count']
+        ))
         for contact in self:
-            contact.message_count = len(contact.message_ids)
+            contact.message_count = message_counts.get(contact, 0)
 
     @api.depends('message_ids.timestamp')
     def _compute_last_message_date(self):
+        last_dates = dict(self.env['whatsapp.message']._read_group(
+            [('contact_id', 'in', self.ids)], ['contact_id'], ['timestamp:max']
+        ))
         for contact in self:
-            if contact.message_ids:
-                contact.last_message_date = max(contact.message_ids.mapped('timestamp'))
-            else:
-                contact.last_message_date = False
+            contact.last_message_date = last_dates.get(contact, False)
 
-    @api.model
-    def create(self, vals):
-        # Format phone number
-        if vals.get('phone_number'):
-            vals['phone_number'] = self._format_phone_number(vals['phone_number'])
-        
-        # Generate WA ID
-        if not vals.get('wa_id') and vals.get('phone_number'):
-            vals['wa_id'] = f"{vals['phone_number']}@c.us"
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            # Format phone number
+            if vals.get('phone_number'):
+                vals['phone_number'] = self._format_phone_number(vals['phone_number'])
+            
+            # Generate WA ID
+            if not vals.get('wa_id') and vals.get('phone_number'):
+                vals['wa_id'] = f"{vals['phone_number']}@c.us"
         
-        contact = super(WhatsAppContact, self).create(vals)
+        contacts = super(WhatsAppContact, self).create(vals_list)
         
         # Try to link with existing partner
-        contact._link_with_partner()
+        contacts._link_with_partner()
         
-        return contact
+        return contacts
 
     def write(self, vals):
         # Format phone number
@@ -137,24 +147,29 @@ class WhatsAppContact(models.Model):
         return phone
 
     def _link_with_partner(self):
-        """Link contact with existing partner"""
-        self.ensure_one()
-        
-        if self.partner_id:
+        """Link contacts with existing partners"""
+        contacts = self.filtered(lambda c: not c.partner_id and c.phone_number)
+        if not contacts:
             return
         
-        # Search for existing partner by phone
-        partner = self.env['res.partner'].search([
-            ('phone', '=', self.phone_number)
-        ], limit=1)
-        
-        if not partner:
-            partner = self.env['res.partner'].search([
-                ('mobile', '=', self.phone_number)
-            ], limit=1)
-        
-        if partner:
-            self.partner_id = partner.id
+        # Search for existing partners by phone or mobile in one query
+        phones = contacts.mapped('phone_number')
+        partners = self.env['res.partner'].search_read([
+            '|',
+            ('phone', 'in', phones),
+            ('mobile', 'in', phones)
+        ], ['phone', 'mobile'])
+        
+        partner_by_phone = {}
+        partner_by_mobile = {}
+        for partner in partners:
+            partner_by_phone.setdefault(partner['phone'], partner['id'])
+            partner_by_mobile.setdefault(partner['mobile'], partner['id'])
+        
+        for contact in contacts:
+            partner_id = partner_by_phone.get(contact.phone_number) or partner_by_mobile.get(contact.phone_number)
+            if partner_id:
+                contact.partner_id = partner_id
 
     def action_send_message(self):
         """Send message to contact"""
@@ -207,7 +222,7 @@ class WhatsAppContact(models.Model):
             'name': f'WhatsApp Lead from {self.name}',
             'phone': self.phone_number,
             'description': f'WhatsApp contact: {self.name}',
-            'source_id': self.env.ref('whatsapp.lead_source_whatsapp').id,
+            'source_id': self.env['crm.lead']._get_whatsapp_source_id(),
             'user_id': self.account_id.user_id.id,
         }
         
@@ -336,6 +351,53 @@ class WhatsAppContact(models.Model):
             }
         }
 
+    @api.model
+    def _upsert_contacts(self, account_id, vals_list):
+        """Create or update contacts of an account in bulk
+
+        Existing contacts are found with one query. New contacts are created in
+        one batch, and existing contacts sharing the same changes are written
+        together, so unchanged contacts cost no query of their own.
+        """
+        # Bulk sync does not need chatter tracking on every contact
+        self = self.with_context(tracking_disable=True)
+        
+        contacts_by_phone = {}
+        for vals in vals_list:
+            vals['phone_number'] = self._format_phone_number(vals['phone_number'])
+            contacts_by_phone[vals['phone_number']] = vals
+        
+        if not contacts_by_phone:
+            return self.browse()
+        
+        # Stored values of the contacts that already exist
+        update_fields = sorted({
+            field for vals in contacts_by_phone.values() for field in vals
+        } - {'account_id', 'phone_number'})
+        existing_rows = self.search_read([
+            ('account_id', '=', account_id),
+            ('phone_number', 'in', list(contacts_by_phone))
+        ], ['phone_number'] + update_fields)
+        
+        # Group existing contacts by their changes, to write each change set once
+        contact_ids_by_changes = defaultdict(list)
+        for row in existing_rows:
+            vals = contacts_by_phone.pop(row['phone_number'])
+            changes = tuple(sorted(
+                (field, value) for field, value in vals.items()
+                if field in row and (row[field] or False) != (value or False)
+            ))
+            if changes:
+                contact_ids_by_changes[changes].append(row['id'])
+        
+        for changes, contact_ids in contact_ids_by_changes.items():
+            self.browse(contact_ids).write(dict(changes))
+        
+        existing_contacts = self.browse([row['id'] for row in existing_rows])
+        if not contacts_by_phone:
+            return existing_contacts
+        return existing_contacts | self.create(list(contacts_by_phone.values()))
+
     @api.model
     def sync_contacts_from_whatsapp(self, account_id):
         """Sync contacts from WhatsApp"""
@@ -347,17 +409,12 @@ class WhatsAppContact(models.Model):
         try:
             # Get contacts from WhatsApp API
             contacts_data = account._get_contacts()
+            now = fields.Datetime.now()
             
+            contact_vals_list = []
             for contact_data in contacts_data:
                 phone_number = contact_data.get('id', '').replace('@c.us', '')
-                
-                # Check if contact exists
-                existing_contact = self.search([
-                    ('account_id', '=', account_id),
-                    ('phone_number', '=', phone_number)
-                ], limit=1)
-                
-                contact_vals = {
+                contact_vals_list.append({
                     'account_id': account_id,
                     'name': contact_data.get('name') or contact_data.get('pushname') or phone_number,
                     'phone_number': phone_number,
@@ -367,13 +424,10 @@ class WhatsAppContact(models.Model):
                     'is_business': contact_data.get('is_business', False),
                     'is_group': contact_data.get('is_group', False),
                     'is_contact': contact_data.get('is_contact', True),
-                    'last_seen': fields.Datetime.now(),
-                }
-                
-                if existing_contact:
-                    existing_contact.write(contact_vals)
-                else:
-                    self.create(contact_vals)
+                    'last_seen': now,
+                })
+            
+            self._upsert_contacts(account_id, contact_vals_list)
             
             return True
             
@@ -381,7 +435,6 @@ class WhatsAppContact(models.Model):
             _logger.error(f'Error syncing contacts: {e}')
             return False
 
-
 class WhatsAppContactTag(models.Model):
     _name = 'whatsapp.contact.tag'
     _description = 'WhatsApp Contact Tag'
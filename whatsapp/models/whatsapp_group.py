@@ -2,10 +2,46 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import SQL, create_index
+import hashlib
+import json
 import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
 
 _logger = logging.getLogger(__name__)
 
+# Group info responses from the WhatsApp API, keyed by (database, account, group),
+# as (fetch time, group info) in fetch order
+GROUP_INFO_CACHE_TTL = 60
+GROUP_INFO_CACHE_SIZE = 256
+_group_info_cache = {}
+
+# Advisory lock namespace of member syncs, the group id being the lock key
+GROUP_SYNC_LOCK = 7381
+
+
+def _store_group_info(cache_key, group_info):
+    """Cache group info, dropping expired entries and the oldest ones over the size limit"""
+    now = time.monotonic()
+    _group_info_cache.pop(cache_key, None)
+    for key, (fetch_time, _info) in list(_group_info_cache.items()):
+        if now - fetch_time < GROUP_INFO_CACHE_TTL and len(_group_info_cache) < GROUP_INFO_CACHE_SIZE:
+            break
+        del _group_info_cache[key]
+    _group_info_cache[cache_key] = (now, group_info)
+
+
+def _get_sync_hash(group_data):
+    """Fingerprint of the group data the sync depends on"""
+    participants = sorted(
+        (p.get('id', ''), bool(p.get('is_admin')), bool(p.get('is_owner')))
+        for p in group_data.get('participants', [])
+    )
+    payload = json.dumps([group_data.get('name'), group_data.get('desc'), participants])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
 
 class WhatsAppGroup(models.Model):
     _name = 'whatsapp.group'
@@ -24,7 +60,7 @@ class WhatsAppGroup(models.Model):
     account_id = fields.Many2one('whatsapp.account', 'WhatsApp Account', required=True, ondelete='cascade')
     
     # Group settings
-    is_member = fields.Boolean('Is Member', default=True, tracking=True)
+    is_member = fields.Boolean('Is Member', default=True)
     is_admin = fields.Boolean('Is Admin', default=False, tracking=True)
     is_owner = fields.Boolean('Is Owner', default=False, tracking=True)
     
@@ -42,7 +78,7 @@ class WhatsAppGroup(models.Model):
     ], string='Status', default='active', tracking=True)
     
     # Statistics
-    member_count = fields.Integer('Member Count', default=0, tracking=True)
+    member_count = fields.Integer('Member Count', default=0)
     admin_count = fields.Integer('Admin Count', default=0)
     message_count = fields.Integer('Message Count', compute='_compute_message_count', store=True)
     
@@ -50,11 +86,18 @@ class WhatsAppGroup(models.Model):
     created_date = fields.Datetime('Created Date', default=fields.Datetime.now)
     joined_date = fields.Datetime('Joined Date', default=fields.Datetime.now)
     left_date = fields.Datetime('Left Date')
-    last_activity = fields.Datetime('Last Activity', tracking=True)
+    last_activity = fields.Datetime('Last Activity')
+    
+    # Member synchronization
+    last_sync = fields.Datetime('Last Member Sync', readonly=True, copy=False)
+    sync_pending = fields.Boolean('Member Sync Pending', default=False, copy=False,
+                                  help='Members will be synced by the background job')
+    sync_hash = fields.Char('Sync Hash', readonly=True, copy=False,
+                            help='Fingerprint of the last synced group data, used to skip unchanged groups')
     
     # Group avatar
     avatar_url = fields.Char('Avatar URL')
-    avatar_image = fields.Binary('Avatar Image', attachment=True)
+    avatar_image = fields.Binary('Avatar Image', attachment=True, prefetch=False)
     
     # Relations
     message_ids = fields.One2many('whatsapp.message', 'group_id', 'Messages')
@@ -73,77 +116,240 @@ class WhatsAppGroup(models.Model):
 
     @api.depends('message_ids')
     def _compute_message_count(self):
+        message_counts = dict(self.env['whatsapp.message']._read_group(
+            [('group_id', 'in', self.ids)], ['group_id'], ['__count']
+        ))
         for group in self:
-            group.message_count = len(group.message_ids)
+            group.message_count = message_counts.get(group, 0)
 
-    @api.model
-    def create(self, vals):
-        # Generate WA group ID
-        if not vals.get('wa_group_id') and vals.get('group_id'):
-            vals['wa_group_id'] = f"{vals['group_id']}@g.us"
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            # Generate WA group ID
+            if not vals.get('wa_group_id') and vals.get('group_id'):
+                vals['wa_group_id'] = f"{vals['group_id']}@g.us"
+        
+        groups = super(WhatsAppGroup, self).create(vals_list)
+        
+        # Sync group members, unless the caller syncs them itself
+        if not self.env.context.get('skip_sync'):
+            groups._queue_member_sync()
         
-        group = super(WhatsAppGroup, self).create(vals)
+        return groups
+
+    def write(self, vals):
+        # Group info fetched before the change is stale now
+        self._forget_group_info()
+        return super(WhatsAppGroup, self).write(vals)
+
+    def _increment_counter(self, field_name, delta):
+        """Atomically add delta to an integer counter column"""
+        assert field_name in ('member_count', 'admin_count'), field_name
+        
+        self.flush_recordset([field_name])
+        self.env.cr.execute(SQL(
+            'UPDATE %s SET %s = COALESCE(%s, 0) + %s WHERE id IN %s',
+            SQL.identifier(self._table),
+            SQL.identifier(field_name),
+            SQL.identifier(field_name),
+            delta,
+            tuple(self.ids),
+        ))
+        self.invalidate_recordset([field_name])
+
+    def _get_group_info(self):
+        """Get group info from WhatsApp API, memoized for a short time"""
+        self.ensure_one()
         
-        # Sync group members
-        group._sync_members()
+        cache_key = (self.env.cr.dbname, self.account_id.id, self.group_id)
+        cached = _group_info_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < GROUP_INFO_CACHE_TTL:
+            return cached[1]
         
-        return group
+        group_info = self.account_id._get_group_info(self.group_id)
+        if group_info:
+            _store_group_info(cache_key, group_info)
+        return group_info
+
+    def _forget_group_info(self):
+        """Drop the cached group info of the groups"""
+        for group in self:
+            _group_info_cache.pop((self.env.cr.dbname, group.account_id.id, group.group_id), None)
+
+    @api.model
+    def _get_sync_debounce(self):
+        """Minimum delay between two member syncs of a group, in seconds"""
+        return int(self.env['ir.config_parameter'].sudo().get_param('whatsapp.group_sync_debounce', 60))
+
+    def _sync_members(self, group_info=None):
+        """Sync group members from WhatsApp
 
-    def _sync_members(self):
-        """Sync group members from WhatsApp"""
+        :param group_info: group data already fetched from WhatsApp, if any
+        :return: True when the members were synced, False when the sync was
+            skipped or failed
+        """
         self.ensure_one()
         
+        # Skip groups synced within the debounce window
+        debounce = self._get_sync_debounce()
+        if self.last_sync and fields.Datetime.now() - self.last_sync < timedelta(seconds=debounce):
+            return False
+        
+        # Skip groups that another transaction is syncing right now
+        self.env.cr.execute('SELECT pg_try_advisory_xact_lock(%s, %s)', [GROUP_SYNC_LOCK, self.id])
+        if not self.env.cr.fetchone()[0]:
+            return False
+        
         try:
             # Get group info from WhatsApp API
-            group_info = self.account_id._get_group_info(self.group_id)
+            if group_info is None:
+                group_info = self._get_group_info()
             
             if not group_info:
-                return
+                return False
             
-            # Update group info
-            self.write({
+            # Group info is written once, after the members are in place
+            group_update = {
                 'name': group_info.get('name', self.name),
                 'description': group_info.get('desc', ''),
                 'member_count': len(group_info.get('participants', [])),
                 'only_admins_can_send': group_info.get('only_admins_can_send', False),
                 'only_admins_can_edit': group_info.get('only_admins_can_edit', False),
-            })
-            
-            # Clear existing members
-            self.member_ids.unlink()
+                'last_sync': fields.Datetime.now(),
+                'last_activity': fields.Datetime.now(),
+                'sync_pending': False,
+                'sync_hash': _get_sync_hash(group_info),
+            }
             
-            # Add members
+            # Index incoming participants by phone number
+            incoming_members = {}
             for participant in group_info.get('participants', []):
-                member_vals = {
+                phone_number = participant.get('id', '').partition('@')[0]
+                incoming_members[phone_number] = {
                     'group_id': self.id,
-                    'phone_number': participant.get('id', '').replace('@c.us', ''),
+                    'phone_number': phone_number,
                     'name': participant.get('name') or participant.get('pushname'),
                     'is_admin': participant.get('is_admin', False),
                     'is_owner': participant.get('is_owner', False),
                     'joined_date': fields.Datetime.now(),
                 }
-                
-                # Find or create contact
-                contact = self.env['whatsapp.contact'].search([
-                    ('account_id', '=', self.account_id.id),
-                    ('phone_number', '=', member_vals['phone_number'])
-                ], limit=1)
-                
-                if not contact:
-                    contact = self.env['whatsapp.contact'].create({
-                        'account_id': self.account_id.id,
-                        'name': member_vals['name'] or member_vals['phone_number'],
-                        'phone_number': member_vals['phone_number'],
-                    })
-                
-                member_vals['contact_id'] = contact.id
-                self.env['whatsapp.group.member'].create(member_vals)
             
-            # Update admin count
-            self.admin_count = len(self.member_ids.filtered('is_admin'))
+            # Remove members that left the group
+            current_members = {member.phone_number: member for member in self.member_ids}
+            departed_members = self.member_ids.filtered(lambda m: m.phone_number not in incoming_members)
+            departed_members.unlink()
+            
+            # Update role changes on members still in the group
+            for phone_number, member in current_members.items():
+                member_vals = incoming_members.get(phone_number)
+                if not member_vals:
+                    continue
+                role_vals = {
+                    'is_admin': member_vals['is_admin'],
+                    'is_owner': member_vals['is_owner'],
+                    'status': 'active',
+                }
+                if any(member[field] != value for field, value in role_vals.items()):
+                    member.write(role_vals)
+            
+            # Add new members, finding or creating their contacts at once
+            new_member_vals_list = [
+                member_vals for phone_number, member_vals in incoming_members.items()
+                if phone_number not in current_members
+            ]
+            if new_member_vals_list:
+                self._resolve_member_contacts(new_member_vals_list)
+                self.env['whatsapp.group.member'].create(new_member_vals_list)
+            
+            # Admin count, members now mirror the incoming participants
+            group_update['admin_count'] = sum(1 for member_vals in incoming_members.values() if member_vals['is_admin'])
+            
+            # Machine-driven sync, no need to track field changes
+            self.with_context(tracking_disable=True, mail_notrack=True).write(group_update)
+            return True
             
         except Exception as e:
             _logger.error(f'Error syncing group members: {e}')
+            return False
+
+    def _queue_member_sync(self):
+        """Queue member sync for the background job
+
+        Falls back to syncing inline when the sync job is not installed.
+
+        :return: 'queued', or when synced inline, 'synced' if every group was
+            synced and 'skipped' otherwise
+        """
+        cron = self.env.ref('whatsapp.ir_cron_whatsapp_sync_group_members', raise_if_not_found=False)
+        if not cron:
+            synced = [group._sync_members() for group in self]
+            return 'synced' if all(synced) else 'skipped'
+        
+        self.write({'sync_pending': True})
+        cron._trigger()
+        return 'queued'
+
+    @api.model
+    def cron_sync_group_members(self, batch_size=50):
+        """Cron job to sync members of groups queued for sync
+
+        A successful sync clears the group's pending flag. Groups that were
+        skipped or failed stay queued and are retried after the debounce delay.
+        """
+        groups = self.search([('sync_pending', '=', True)], order='last_sync, id', limit=batch_size)
+        synced_count = 0
+        for group in groups:
+            try:
+                if group._sync_members():
+                    synced_count += 1
+            except Exception as e:
+                _logger.error(f'Error syncing members for group {group.name}: {e}')
+        
+        # Reschedule while groups are still waiting: right away while syncs make
+        # progress, after the debounce delay when the whole batch was skipped
+        if self.search_count([('sync_pending', '=', True)], limit=1):
+            cron = self.env.ref('whatsapp.ir_cron_whatsapp_sync_group_members')
+            if synced_count:
+                cron._trigger()
+            else:
+                cron._trigger(fields.Datetime.now() + timedelta(seconds=self._get_sync_debounce()))
+
+    def _resolve_member_contacts(self, member_vals_list):
+        """Set contact_id on member values, creating missing contacts in one batch"""
+        self.ensure_one()
+        
+        Contact = self.env['whatsapp.contact']
+        contact_phones = {
+            vals['phone_number']: Contact._format_phone_number(vals['phone_number'])
+            for vals in member_vals_list
+        }
+        
+        contact_by_phone = {
+            contact['phone_number']: contact['id']
+            for contact in Contact.search_read([
+                ('account_id', '=', self.account_id.id),
+                ('phone_number', 'in', list(contact_phones.values()))
+            ], ['phone_number'])
+        }
+        
+        missing_contacts = {}
+        for vals in member_vals_list:
+            phone = contact_phones[vals['phone_number']]
+            if phone not in contact_by_phone and phone not in missing_contacts:
+                missing_contacts[phone] = {
+                    'account_id': self.account_id.id,
+                    'name': vals['name'] or vals['phone_number'],
+                    'phone_number': phone,
+                }
+        
+        if missing_contacts:
+            for contact in Contact.create(list(missing_contacts.values())):
+                contact_by_phone[contact.phone_number] = contact.id
+        
+        for vals in member_vals_list:
+            vals['contact_id'] = contact_by_phone.get(contact_phones[vals['phone_number']])
+        
+        return member_vals_list
 
     def action_send_message(self):
         """Send message to group"""
@@ -202,13 +408,27 @@ class WhatsAppGroup(models.Model):
         self.ensure_one()
         
         try:
-            self._sync_members()
+            result = self._queue_member_sync()
+            if result == 'skipped':
+                return {
+                    'type': 'ir.actions.client',
+                    'tag': 'display_notification',
+                    'params': {
+                        'message': _('Group members were not synced: they were synced recently or are being synced right now'),
+                        'type': 'warning',
+                    }
+                }
+            
+            if result == 'queued':
+                message = _('Group members sync queued')
+            else:
+                message = _('Group members synced successfully')
             
             return {
                 'type': 'ir.actions.client',
                 'tag': 'display_notification',
                 'params': {
-                    'message': _('Group members synced successfully'),
+                    'message': message,
                     'type': 'success',
                 }
             }
@@ -251,7 +471,7 @@ class WhatsAppGroup(models.Model):
             self.account_id._remove_group_member(self.group_id, member.phone_number)
             
             member.unlink()
-            self.member_count -= 1
+            self._increment_counter('member_count', -1)
             
             return {
                 'type': 'ir.actions.client',
@@ -313,6 +533,21 @@ class WhatsAppGroup(models.Model):
         
         return project.get_formview_action()
 
+    @api.model
+    def _is_group_unchanged(self, group, group_data):
+        """Check whether the gateway data shows no change since the last sync
+
+        :param group: dict with the group's ``last_activity`` and ``sync_hash``
+        """
+        updated_at = group_data.get('updated_at') or group_data.get('lastUpdated')
+        if updated_at and group['last_activity']:
+            return updated_at <= group['last_activity'].timestamp()
+        
+        if 'participants' in group_data and group['sync_hash']:
+            return group['sync_hash'] == _get_sync_hash(group_data)
+        
+        return False
+    
     @api.model
     def sync_groups_from_whatsapp(self, account_id):
         """Sync groups from WhatsApp"""
@@ -325,32 +560,93 @@ class WhatsAppGroup(models.Model):
             # Get groups from WhatsApp API
             groups_data = account._get_groups()
             
+            # Load the account's known groups once, without binary fields
+            existing_groups = {
+                group['group_id']: group
+                for group in self.search_read(
+                    [('account_id', '=', account_id)],
+                    ['id', 'group_id', 'last_activity', 'sync_hash']
+                )
+            }
+            
+            # Collect changed and new groups
+            changed_groups = {}
             for group_data in groups_data:
-                group_id = group_data.get('id', '').replace('@g.us', '')
+                group_id = group_data.get('id', '').partition('@')[0]
                 
-                # Check if group exists
-                existing_group = self.search([
-                    ('account_id', '=', account_id),
-                    ('group_id', '=', group_id)
-                ], limit=1)
+                # Skip groups that did not change since the last sync
+                existing = existing_groups.get(group_id)
+                if existing and self._is_group_unchanged(existing, group_data):
+                    continue
                 
-                group_vals = {
-                    'account_id': account_id,
-                    'group_id': group_id,
-                    'wa_group_id': group_data.get('id'),
-                    'name': group_data.get('name', 'Unknown Group'),
-                    'description': group_data.get('desc', ''),
-                    'member_count': len(group_data.get('participants', [])),
-                    'is_member': True,
-                    'last_activity': fields.Datetime.now(),
-                }
+                changed_groups[group_id] = group_data
+            
+            if not changed_groups:
+                return True
+            
+            # Update the known groups in one query; last_activity and sync_hash
+            # are only advanced by a successful member sync
+            group_ids = {
+                group_id: existing_groups[group_id]['id']
+                for group_id in changed_groups
+                if group_id in existing_groups
+            }
+            if group_ids:
+                rows = SQL(', ').join(
+                    SQL(
+                        '(%s, %s, %s, %s, %s)',
+                        id_, changed_groups[group_id].get('id'),
+                        changed_groups[group_id].get('name', 'Unknown Group'),
+                        changed_groups[group_id].get('desc', ''),
+                        len(changed_groups[group_id].get('participants', [])),
+                    )
+                    for group_id, id_ in group_ids.items()
+                )
+                self.flush_model()
+                self.env.cr.execute(SQL(
+                    """UPDATE whatsapp_group AS g
+                          SET wa_group_id = v.wa_group_id,
+                              name = v.name,
+                              description = v.description,
+                              member_count = v.member_count,
+                              is_member = TRUE,
+                              write_uid = %s,
+                              write_date = %s
+                         FROM (VALUES %s) AS v(id, wa_group_id, name, description, member_count)
+                        WHERE g.id = v.id""",
+                    self.env.uid, fields.Datetime.now(), rows,
+                ))
+                self.invalidate_model()
+                self.browse(group_ids.values())._forget_group_info()
+            
+            # Create the new groups through the ORM, members are synced below
+            new_groups = [
+                (group_id, group_data)
+                for group_id, group_data in changed_groups.items()
+                if group_id not in group_ids
+            ]
+            if new_groups:
+                groups = self.with_context(skip_sync=True).create([
+                    {
+                        'account_id': account_id,
+                        'group_id': group_id,
+                        'wa_group_id': group_data.get('id'),
+                        'name': group_data.get('name', 'Unknown Group'),
+                        'description': group_data.get('desc', ''),
+                        'member_count': len(group_data.get('participants', [])),
+                        'is_member': True,
+                    }
+                    for group_id, group_data in new_groups
+                ])
+                group_ids.update(zip((group_id for group_id, _data in new_groups), groups.ids))
+            
+            for group_id, group_data in changed_groups.items():
+                group = self.browse(group_ids[group_id])
                 
-                if existing_group:
-                    existing_group.write(group_vals)
-                    existing_group._sync_members()
-                else:
-                    group = self.create(group_vals)
-                    group._sync_members()
+                # Participants already came with the group list, no API call needed;
+                # a skipped or failed sync is queued so the group is not left unsynced
+                if 'participants' not in group_data or not group._sync_members(group_info=group_data):
+                    group._queue_member_sync()
             
             return True
             
@@ -395,21 +691,53 @@ class WhatsAppGroupMember(models.Model):
         ('unique_member_group', 'unique(phone_number, group_id)', 'Member must be unique per group!'),
     ]
 
-    @api.model
-    def create(self, vals):
-        # Link with contact if exists
-        if vals.get('phone_number') and vals.get('account_id'):
-            contact = self.env['whatsapp.contact'].search([
-                ('account_id', '=', vals['account_id']),
-                ('phone_number', '=', vals['phone_number'])
-            ], limit=1)
+    def init(self):
+        # Account-first index for attributing incoming messages to group members
+        create_index(self._cr, 'whatsapp_group_member_account_phone_idx', self._table, ['account_id', 'phone_number'])
+        # Group-first indexes for member lookups within a group and its active members
+        create_index(self._cr, 'whatsapp_group_member_group_phone_idx', self._table, ['group_id', 'phone_number'])
+        create_index(
+            self._cr, 'whatsapp_group_member_group_active_idx', self._table,
+            ['group_id'], where="status = 'active'",
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Link with contacts if they exist, account taken from the group when not given
+        vals_to_link = [
+            vals for vals in vals_list
+            if vals.get('phone_number') and (vals.get('account_id') or vals.get('group_id'))
+            and not vals.get('contact_id')
+        ]
+        
+        if vals_to_link:
+            groups = self.env['whatsapp.group'].browse({vals['group_id'] for vals in vals_to_link if vals.get('group_id')})
+            account_by_group = {group.id: group.account_id.id for group in groups}
+            
+            phones_by_account = defaultdict(set)
+            for vals in vals_to_link:
+                account_id = vals.get('account_id') or account_by_group.get(vals['group_id'])
+                if account_id:
+                    phones_by_account[account_id].add(vals['phone_number'])
+            
+            # One search per account
+            contact_by_key = {}
+            for account_id, phone_numbers in phones_by_account.items():
+                for contact in self.env['whatsapp.contact'].search_read([
+                    ('account_id', '=', account_id),
+                    ('phone_number', 'in', list(phone_numbers))
+                ], ['phone_number', 'name']):
+                    contact_by_key[(account_id, contact['phone_number'])] = contact
             
-            if contact:
-                vals['contact_id'] = contact.id
-                if not vals.get('name'):
-                    vals['name'] = contact.name
+            for vals in vals_to_link:
+                account_id = vals.get('account_id') or account_by_group.get(vals['group_id'])
+                contact = contact_by_key.get((account_id, vals['phone_number']))
+                if contact:
+                    vals['contact_id'] = contact['id']
+                    if not vals.get('name'):
+                        vals['name'] = contact['name']
         
-        return super(WhatsAppGroupMember, self).create(vals)
+        return super(WhatsAppGroupMember, self).create(vals_list)
 
     def action_make_admin(self):
         """Make member admin"""
@@ -423,7 +751,7 @@ class WhatsAppGroupMember(models.Model):
             self.group_id.account_id._make_group_admin(self.group_id.group_id, self.phone_number)
             
             self.is_admin = True
-            self.group_id.admin_count += 1
+            self.group_id._increment_counter('admin_count', 1)
             
             return {
                 'type': 'ir.actions.client',
@@ -453,7 +781,7 @@ class WhatsAppGroupMember(models.Model):
             self.group_id.account_id._remove_group_admin(self.group_id.group_id, self.phone_number)
             
             self.is_admin = False
-            self.group_id.admin_count -= 1
+            self.group_id._increment_counter('admin_count', -1)
             
             return {
                 'type': 'ir.actions.client',
@@ -2,19 +2,55 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
-import json
+from odoo.tools import SQL, create_index
 import logging
-import base64
+import uuid
+from collections import defaultdict
 from datetime import datetime, timedelta
 
+import requests
+from markupsafe import Markup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 _logger = logging.getLogger(__name__)
 
+# Characters of the message content used as its name
+MESSAGE_NAME_LENGTH = 60
+
+# Key of the transaction's resolved contacts in cr.precommit.data
+CONTACT_CACHE_KEY = 'whatsapp.contact.cache'
+
+# Notification body, the message content is escaped when formatted in
+NOTIFICATION_BODY = Markup('<p>%s</p>')
+
+# Shared HTTP session so media downloads reuse pooled keep-alive connections
+_media_session = requests.Session()
+_media_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.3))
+_media_session.mount('https://', _media_adapter)
+_media_session.mount('http://', _media_adapter)
+
+
+def _set_media_vals(message_data, message_vals):
+    """Copy media details of a webhook message into the message values"""
+    message_vals.update({
+        'media_url': message_data.get('media_url'),
+        'media_type': message_data.get('mime_type'),
+        'media_size': message_data.get('file_size'),
+    })
+
+
+# Webhook message type -> function completing the message values
+_MESSAGE_TYPE_HANDLERS = {
+    'image': _set_media_vals,
+}
+
 
 class WhatsAppMessage(models.Model):
     _name = 'whatsapp.message'
     _description = 'WhatsApp Message'
     _order = 'timestamp desc'
-    _rec_name = 'message'
+    _rec_name = 'name'
     _inherit = ['mail.thread', 'mail.activity.mixin']
 
     # Message identification
@@ -28,6 +64,8 @@ class WhatsAppMessage(models.Model):
     
     # Message details
     message = fields.Text('Message Content', required=True)
+    name = fields.Char('Name', compute='_compute_name', store=True, index='trigram',
+                       help='Start of the message content, used to display and search messages')
     message_type = fields.Selection([
         ('text', 'Text'),
         ('image', 'Image'),
@@ -125,62 +163,193 @@ class WhatsAppMessage(models.Model):
     error_message = fields.Text('Error Message')
     
     # Metadata
-    raw_data = fields.Text('Raw Data', help='Original message data from WhatsApp API')
+    raw_data = fields.Json('Raw Data', help='Original message data from WhatsApp API')
+    processing_pending = fields.Boolean('Processing Pending', default=False, copy=False,
+                                        help='Auto-reply, lead and notifications will be handled by the background job')
     company_id = fields.Many2one('res.company', 'Company', related='account_id.company_id', store=True)
     
     _sql_constraints = [
         ('unique_message_id', 'unique(message_id)', 'Message ID must be unique!'),
     ]
 
+    def init(self):
+        # Partial index for the recent auto-reply check
+        create_index(
+            self._cr, 'whatsapp_message_auto_reply_idx', self._table,
+            ['account_id', 'to_number', 'timestamp DESC'], where='is_auto_reply',
+        )
+        # Partial index for the message processing queue
+        create_index(self._cr, 'whatsapp_message_processing_pending_idx', self._table, ['id'], where='processing_pending')
+        # Partial index for delivery status polling and retries, limited to non-final statuses
+        create_index(
+            self._cr, 'whatsapp_message_pending_status_idx', self._table,
+            ['status', 'timestamp'], where="status IN ('pending', 'sent', 'delivered')",
+        )
+
+    @api.depends('message')
+    def _compute_name(self):
+        for message in self:
+            message.name = (message.message or '')[:MESSAGE_NAME_LENGTH]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        default_account_id = self.env.context.get('default_account_id')
+        
+        # Collect the contact each message belongs to
+        contact_keys = {}
+        for vals in vals_list:
+            # Auto-generate message_id if not provided
+            if not vals.get('message_id'):
+                vals['message_id'] = self._generate_message_id()
+            
+            contact_key = self._get_contact_key(vals, default_account_id)
+            if contact_key:
+                name = vals.get('from_name') if vals.get('direction') == 'incoming' else vals.get('to_name')
+                contact_keys.setdefault(contact_key, name)
+        
+        # Set contact and partner based on phone number, resolved once for the batch
+        if contact_keys:
+            contacts = self._get_or_create_contacts(contact_keys)
+            for vals in vals_list:
+                contact = contacts.get(self._get_contact_key(vals, default_account_id))
+                if contact:
+                    vals['contact_id'] = contact.id
+                    if contact.partner_id:
+                        vals['partner_id'] = contact.partner_id.id
+        
+        # Process messages in the background through the queue cron, if present
+        cron = self.env.ref('whatsapp.ir_cron_whatsapp_process_message_queue', raise_if_not_found=False)
+        if cron:
+            for vals in vals_list:
+                vals['processing_pending'] = True
+        
+        messages = super(WhatsAppMessage, self).create(vals_list)
+        
+        if cron:
+            cron._trigger()
+        else:
+            messages._process_messages()
+        
+        return messages
+
+    def _generate_message_id(self):
+        """Generate unique message ID"""
+        return str(uuid.uuid4())
+
     @api.model
-    def create(self, vals):
-        # Auto-generate message_id if not provided
-        if not vals.get('message_id'):
-            vals['message_id'] = self._generate_message_id()
-        
-        # Set contact and partner based on phone number
+    def _get_contact_key(self, vals, default_account_id=None):
+        """Return the (account_id, phone_number) of the contact a message belongs to"""
+        account_id = vals.get('account_id') or default_account_id
         if vals.get('from_number') and vals.get('direction') == 'incoming':
-            contact = self._get_or_create_contact(vals['from_number'], vals.get('from_name'))
-            vals['contact_id'] = contact.id
-            if contact.partner_id:
-                vals['partner_id'] = contact.partner_id.id
-        
-        elif vals.get('to_number') and vals.get('direction') == 'outgoing':
-            contact = self._get_or_create_contact(vals['to_number'], vals.get('to_name'))
-            vals['contact_id'] = contact.id
-            if contact.partner_id:
-                vals['partner_id'] = contact.partner_id.id
+            return (account_id, vals['from_number'])
+        if vals.get('to_number') and vals.get('direction') == 'outgoing':
+            return (account_id, vals['to_number'])
+        return None
+
+    @api.model
+    def _get_or_create_contacts(self, contact_keys):
+        """Get or create WhatsApp contacts in batch
+
+        :param contact_keys: dict mapping (account_id, phone_number) to a contact name
+        :return: dict mapping (account_id, phone_number) to whatsapp.contact records
+        """
+        Contact = self.env['whatsapp.contact']
+        keys_by_formatted = {}
+        for account_id, phone_number in contact_keys:
+            formatted_key = (account_id, Contact._format_phone_number(phone_number))
+            keys_by_formatted.setdefault(formatted_key, []).append((account_id, phone_number))
+        
+        # Contacts already resolved in this transaction, dropped on commit, rollback
+        # and by _forget_cached_contacts after a savepoint rollback
+        contact_cache = self.env.cr.precommit.data.setdefault(CONTACT_CACHE_KEY, {})
+        contact_by_formatted = {
+            formatted_key: Contact.browse(contact_cache[formatted_key])
+            for formatted_key in keys_by_formatted if formatted_key in contact_cache
+        }
+        uncached_keys = [key for key in keys_by_formatted if key not in contact_by_formatted]
+        
+        # Find existing contacts in one search
+        if uncached_keys:
+            contacts = Contact.search([
+                ('account_id', 'in', list({account_id for account_id, dummy in uncached_keys})),
+                ('phone_number', 'in', list({phone_number for dummy, phone_number in uncached_keys}))
+            ])
+            for contact in contacts:
+                formatted_key = (contact.account_id.id, contact.phone_number)
+                if formatted_key in keys_by_formatted:
+                    contact_by_formatted[formatted_key] = contact
+        
+        # Create missing contacts at once
+        missing_keys = [key for key in keys_by_formatted if key not in contact_by_formatted]
+        if missing_keys:
+            new_contacts = Contact.create([{
+                'account_id': account_id,
+                'name': contact_keys[keys_by_formatted[(account_id, phone_number)][0]] or phone_number,
+                'phone_number': phone_number,
+            } for account_id, phone_number in missing_keys])
+            contact_by_formatted.update(zip(missing_keys, new_contacts))
         
-        message = super(WhatsAppMessage, self).create(vals)
+        contact_cache.update((key, contact.id) for key, contact in contact_by_formatted.items())
         
-        # Process message after creation
-        message._process_message()
+        contact_by_key = {}
+        for formatted_key, keys in keys_by_formatted.items():
+            for key in keys:
+                contact_by_key[key] = contact_by_formatted[formatted_key]
         
-        return message
+        return contact_by_key
 
-    def _generate_message_id(self):
-        """Generate unique message ID"""
-        import uuid
-        return str(uuid.uuid4())
+    @api.model
+    def _forget_cached_contacts(self):
+        """Drop the contacts cached for the transaction
+
+        To be called when a savepoint is rolled back, as contacts created
+        inside it are rolled back too.
+        """
+        self.env.cr.precommit.data.pop(CONTACT_CACHE_KEY, None)
 
     def _get_or_create_contact(self, phone_number, name=None):
         """Get or create WhatsApp contact"""
         account_id = self.env.context.get('default_account_id') or self.account_id.id
+        key = (account_id, phone_number)
+        return self._get_or_create_contacts({key: name})[key]
+
+    def _process_messages(self):
+        """Process messages after creation, notifying once for the whole batch"""
+        for message in self:
+            message._process_message()
         
-        contact = self.env['whatsapp.contact'].search([
-            ('account_id', '=', account_id),
-            ('phone_number', '=', phone_number)
-        ], limit=1)
+        self._update_contacts_last_seen()
+        self._create_leads_from_messages()
+        self._send_notification()
+
+    @api.model
+    def process_message_queue(self, batch_size=100):
+        """Cron job to process messages queued by create"""
+        messages = self.search([('processing_pending', '=', True)], order='id', limit=batch_size)
+        messages.write({'processing_pending': False})
         
-        if not contact:
-            contact_vals = {
-                'account_id': account_id,
-                'name': name or phone_number,
-                'phone_number': phone_number,
-            }
-            contact = self.env['whatsapp.contact'].create(contact_vals)
+        for message in messages:
+            try:
+                with self.env.cr.savepoint():
+                    message._process_message()
+            except Exception as e:
+                self._forget_cached_contacts()
+                _logger.error(f'Error processing message {message.message_id}: {e}')
+        
+        messages._update_contacts_last_seen()
+        
+        try:
+            with self.env.cr.savepoint():
+                messages._create_leads_from_messages()
+        except Exception as e:
+            self._forget_cached_contacts()
+            _logger.error(f'Error creating leads from messages: {e}')
+        
+        messages._send_notification()
         
-        return contact
+        # Reschedule right away while messages are still waiting
+        if self.search_count([('processing_pending', '=', True)], limit=1):
+            self.env.ref('whatsapp.ir_cron_whatsapp_process_message_queue')._trigger()
 
     def _process_message(self):
         """Process message after creation"""
@@ -189,17 +358,31 @@ class WhatsAppMessage(models.Model):
         # Handle auto-reply for incoming messages
         if self.direction == 'incoming' and self.account_id.auto_reply and self.message_type == 'text':
             self._handle_auto_reply()
+
+    def _update_contacts_last_seen(self):
+        """Set contacts last seen to their latest message, in one query for the batch"""
+        last_seen_by_contact = {}
+        for message in self.filtered('contact_id'):
+            contact_id = message.contact_id.id
+            if contact_id not in last_seen_by_contact or message.timestamp > last_seen_by_contact[contact_id]:
+                last_seen_by_contact[contact_id] = message.timestamp
+        
+        if not last_seen_by_contact:
+            return
         
-        # Create lead if configured
-        if self.direction == 'incoming' and self.account_id.create_lead_from_message:
-            self._create_lead_from_message()
-        
-        # Update contact last seen
-        if self.contact_id:
-            self.contact_id.last_seen = self.timestamp
-        
-        # Send notification
-        self._send_notification()
+        contacts = self.env['whatsapp.contact'].browse(list(last_seen_by_contact))
+        contacts.flush_recordset(['last_seen'])
+        self.env.cr.execute(SQL(
+            """UPDATE whatsapp_contact AS contact
+               SET last_seen = GREATEST(contact.last_seen, latest.last_seen)
+               FROM (VALUES %s) AS latest(id, last_seen)
+               WHERE contact.id = latest.id""",
+            SQL(', ').join(
+                SQL('(%s, %s::timestamp)', contact_id, last_seen)
+                for contact_id, last_seen in last_seen_by_contact.items()
+            ),
+        ))
+        contacts.invalidate_recordset(['last_seen'])
 
     def _handle_auto_reply(self):
         """Handle auto-reply for incoming messages"""
@@ -208,12 +391,19 @@ class WhatsAppMessage(models.Model):
         if not self.account_id.auto_reply_message:
             return
         
-        # Check if auto-reply was already sent recently
+        # Only one transaction replies to a sender at a time, the lock is released at commit
+        self.env.cr.execute(
+            'SELECT pg_try_advisory_xact_lock(%s, hashtext(%s))',
+            [self.account_id.id, self.from_number]
+        )
+        if not self.env.cr.fetchone()[0]:
+            return
+        
+        # Check if auto-reply was already sent recently, auto-replies are always outgoing
         recent_auto_reply = self.search([
+            ('is_auto_reply', '=', True),
             ('account_id', '=', self.account_id.id),
             ('to_number', '=', self.from_number),
-            ('direction', '=', 'outgoing'),
-            ('is_auto_reply', '=', True),
             ('timestamp', '>', fields.Datetime.now() - timedelta(hours=1))
         ], limit=1)
         
@@ -222,87 +412,111 @@ class WhatsAppMessage(models.Model):
         
         # Send auto-reply
         try:
-            self.account_id.send_message(
+            reply = self.account_id.send_message(
                 to=self.from_number,
                 message=self.account_id.auto_reply_message,
                 message_type='text'
             )
+            reply.is_auto_reply = True
         except Exception as e:
             _logger.error(f'Error sending auto-reply: {e}')
 
-    def _create_lead_from_message(self):
-        """Create CRM lead from message"""
-        self.ensure_one()
-        
-        if self.lead_id:
+    def _create_leads_from_messages(self):
+        """Create CRM leads from incoming messages
+
+        Open leads are looked up with one search for the batch, and missing
+        leads are created together, one per phone number.
+        """
+        messages = self.filtered(
+            lambda m: m.direction == 'incoming' and m.from_number and not m.lead_id
+            and m.account_id.create_lead_from_message
+        )
+        if not messages:
             return
         
-        # Find existing lead for this contact
-        existing_lead = self.env['crm.lead'].search([
-            ('phone', '=', self.from_number),
+        # Find existing leads for these contacts
+        lead_by_phone = {}
+        for lead in self.env['crm.lead'].search_read([
+            ('phone', 'in', list(set(messages.mapped('from_number')))),
             ('stage_id.is_won', '=', False),
-        ], limit=1)
-        
-        if existing_lead:
-            self.lead_id = existing_lead.id
-            return
-        
-        # Create new lead
-        lead_vals = {
-            'name': f'WhatsApp Lead from {self.from_name or self.from_number}',
-            'phone': self.from_number,
-            'description': f'WhatsApp message: {self.message}',
-            'source_id': self.env.ref('whatsapp.lead_source_whatsapp').id,
-            'user_id': self.account_id.user_id.id,
-            'team_id': self.account_id.user_id.team_id.id,
-        }
-        
-        if self.partner_id:
-            lead_vals['partner_id'] = self.partner_id.id
-        
-        lead = self.env['crm.lead'].create(lead_vals)
-        self.lead_id = lead.id
+        ], ['phone']):
+            lead_by_phone.setdefault(lead['phone'], lead['id'])
+        
+        # Create new leads, from the first message of each number
+        source_id = self.env['crm.lead']._get_whatsapp_source_id()
+        new_lead_vals = {}
+        for message in messages:
+            if message.from_number in lead_by_phone or message.from_number in new_lead_vals:
+                continue
+            lead_vals = {
+                'name': f'WhatsApp Lead from {message.from_name or message.from_number}',
+                'phone': message.from_number,
+                'description': f'WhatsApp message: {message.message}',
+                'source_id': source_id,
+                'user_id': message.account_id.user_id.id,
+                'team_id': message.account_id.user_id.team_id.id,
+            }
+            if message.partner_id:
+                lead_vals['partner_id'] = message.partner_id.id
+            new_lead_vals[message.from_number] = lead_vals
+        
+        if new_lead_vals:
+            leads = self.env['crm.lead'].create(list(new_lead_vals.values()))
+            lead_by_phone.update(zip(new_lead_vals, leads.ids))
+        
+        # Link messages to their lead, one write per lead
+        messages_by_lead = defaultdict(lambda: self.browse())
+        for message in messages:
+            messages_by_lead[lead_by_phone[message.from_number]] |= message
+        for lead_id, lead_messages in messages_by_lead.items():
+            lead_messages.lead_id = lead_id
 
     def _send_notification(self):
-        """Send notification for new message"""
-        self.ensure_one()
-        
-        if self.direction == 'incoming':
+        """Send notifications for new messages
+
+        Bus notifications are queued by the bus and written in a single insert
+        at commit, so a whole batch of messages costs one round-trip.
+        """
+        incoming_messages = self.filtered(lambda m: m.direction == 'incoming')
+        
+        # Warm the prefetch cache for the recipients of the whole batch
+        incoming_messages.mapped('account_id.user_id.partner_id')
+        
+        notifications = []
+        for message in incoming_messages:
+            partner = message.account_id.user_id.partner_id
+            sender = message.from_name or message.from_number
+            
             # Use Odoo 18 message_notify for better integration
             try:
-                self.message_notify(
-                    partner_ids=[self.account_id.user_id.partner_id.id],
-                    subject=f'WhatsApp Message from {self.from_name or self.from_number}',
-                    body=f'<p>{self.message}</p>',
+                message.message_notify(
+                    partner_ids=[partner.id],
+                    subject=f'WhatsApp Message from {sender}',
+                    body=NOTIFICATION_BODY % message.message,
                     subtype_xmlid='mail.mt_comment'
                 )
             except Exception as e:
                 _logger.error(f'Error sending notification via message_notify: {e}')
                 # Fallback to bus notification
-                self.env['bus.bus']._sendone(
-                    self.account_id.user_id.partner_id,
-                    'mail.message/inbox',
-                    {
-                        'type': 'info',
-                        'title': 'WhatsApp Message',
-                        'message': f'New WhatsApp message from {self.from_name or self.from_number}',
-                    }
-                )
+                notifications.append((partner, 'mail.message/inbox', {
+                    'type': 'info',
+                    'title': 'WhatsApp Message',
+                    'message': f'New WhatsApp message from {sender}',
+                }))
             
-            # Send bus notification for WhatsApp module
-            self.env['bus.bus']._sendone(
-                self.account_id.user_id.partner_id,
-                'whatsapp.message/new',
-                {
-                    'type': 'whatsapp_message',
-                    'message_id': self.id,
-                    'account_id': self.account_id.id,
-                    'from_number': self.from_number,
-                    'from_name': self.from_name,
-                    'message': self.message,
-                    'message_type': self.message_type,
-                }
-            )
+            # Bus notification for WhatsApp module
+            notifications.append((partner, 'whatsapp.message/new', {
+                'type': 'whatsapp_message',
+                'message_id': message.id,
+                'account_id': message.account_id.id,
+                'from_number': message.from_number,
+                'from_name': message.from_name,
+                'message': message.message,
+                'message_type': message.message_type,
+            }))
+        
+        for partner, notification_type, payload in notifications:
+            self.env['bus.bus']._sendone(partner, notification_type, payload)
 
     def action_reply(self):
         """Open reply dialog"""
@@ -349,7 +563,7 @@ class WhatsAppMessage(models.Model):
             'name': f'WhatsApp Lead from {self.from_name or self.from_number}',
             'phone': self.from_number,
             'description': f'WhatsApp message: {self.message}',
-            'source_id': self.env.ref('whatsapp.lead_source_whatsapp').id,
+            'source_id': self.env['crm.lead']._get_whatsapp_source_id(),
             'user_id': self.account_id.user_id.id,
         }
         
@@ -386,16 +600,22 @@ class WhatsAppMessage(models.Model):
         return partner.get_formview_action()
 
     def mark_as_read(self):
-        """Mark message as read"""
-        self.ensure_one()
+        """Mark messages as read"""
+        to_mark = self.filtered(lambda m: m.status != 'read')
+        if not to_mark:
+            return
         
-        if self.status != 'read':
-            self.status = 'read'
-            self.read_date = fields.Datetime.now()
-            
-            # Send read receipt to WhatsApp
+        to_mark.write({
+            'status': 'read',
+            'read_date': fields.Datetime.now(),
+        })
+        
+        # Send read receipts to WhatsApp, one call per account
+        for account in to_mark.account_id:
             try:
-                self.account_id._send_read_receipt(self.wa_message_id)
+                account._send_read_receipt(
+                    to_mark.filtered(lambda m: m.account_id == account).mapped('wa_message_id')
+                )
             except Exception as e:
                 _logger.error(f'Error sending read receipt: {e}')
 
@@ -408,25 +628,21 @@ class WhatsAppMessage(models.Model):
         
         try:
             # Download media from WhatsApp API
-            import requests
-            response = requests.get(self.media_url)
-            
-            if response.status_code == 200:
-                # Create attachment
-                attachment_vals = {
-                    'name': f'WhatsApp_{self.message_type}_{self.id}',
-                    'datas': base64.b64encode(response.content),
-                    'res_model': 'whatsapp.message',
-                    'res_id': self.id,
-                    'mimetype': response.headers.get('content-type', 'application/octet-stream'),
-                }
-                
-                attachment = self.env['ir.attachment'].create(attachment_vals)
-                self.attachment_id = attachment.id
-                
-                return attachment.get_formview_action()
-            else:
+            response = _media_session.get(self.media_url, timeout=(3, 30))
+            if response.status_code != 200:
                 raise UserError(_('Failed to download media'))
+            
+            # Create attachment from the raw bytes, no base64 round-trip
+            attachment = self.env['ir.attachment'].create({
+                'name': f'WhatsApp_{self.message_type}_{self.id}',
+                'raw': response.content,
+                'res_model': 'whatsapp.message',
+                'res_id': self.id,
+                'mimetype': response.headers.get('content-type', 'application/octet-stream'),
+            })
+            self.attachment_id = attachment.id
+            
+            return attachment.get_formview_action()
                 
         except Exception as e:
             _logger.error(f'Error downloading attachment: {e}')
@@ -454,16 +670,13 @@ class WhatsAppMessage(models.Model):
                 'from_number': message_data.get('from', '').replace('@c.us', ''),
                 'from_name': message_data.get('name'),
                 'timestamp': fields.Datetime.now(),
-                'raw_data': json.dumps(webhook_data),
+                'raw_data': webhook_data,
             }
             
             # Handle different message types
-            if message_data.get('type') == 'image':
-                message_vals.update({
-                    'media_url': message_data.get('media_url'),
-                    'media_type': message_data.get('mime_type'),
-                    'media_size': message_data.get('file_size'),
-                })
+            type_handler = _MESSAGE_TYPE_HANDLERS.get(message_data.get('type'))
+            if type_handler:
+                type_handler(message_data, message_vals)
             
             # Create message
             message = self.create(message_vals)
@@ -472,4 +685,97 @@ class WhatsAppMessage(models.Model):
             
         except Exception as e:
             _logger.error(f'Error processing webhook message: {e}')
-            return None
\ No newline at end of file
+            return None
+
+class WhatsAppBulkMessageJob(models.Model):
+    _name = 'whatsapp.bulk.message.job'
+    _description = 'WhatsApp Bulk Message Job'
+    _order = 'create_date desc'
+
+    account_id = fields.Many2one('whatsapp.account', 'WhatsApp Account', required=True, ondelete='cascade')
+    message = fields.Text('Message')
+    message_type = fields.Selection([
+        ('text', 'Text'),
+        ('image', 'Image'),
+        ('document', 'Document'),
+    ], string='Message Type', default='text', required=True)
+    template_id = fields.Many2one('whatsapp.template', 'Template')
+    attachment_id = fields.Many2one('ir.attachment', 'Attachment')
+    
+    # Messages to send, as [number, message content] pairs
+    recipient_messages = fields.Json('Recipient Messages')
+    delay_between_messages = fields.Integer('Delay Between Messages (seconds)')
+    personalize_message = fields.Boolean('Personalize Message')
+    
+    status = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ], string='Status', default='pending', required=True, index=True)
+    total_recipients = fields.Integer('Total Recipients')
+    success_count = fields.Integer('Success Count')
+    error_count = fields.Integer('Error Count')
+    error_message = fields.Text('Error Message')
+    completed_date = fields.Datetime('Completed Date')
+
+    def _queue(self):
+        """Queue the jobs for the background sender
+
+        Falls back to sending inline when the sender job is not installed.
+        Returns True when the jobs were queued.
+        """
+        cron = self.env.ref('whatsapp.ir_cron_whatsapp_process_bulk_jobs', raise_if_not_found=False)
+        if not cron:
+            self.process()
+            return False
+        
+        cron._trigger()
+        return True
+
+    def process(self):
+        """Send the messages of the jobs"""
+        for job in self:
+            job.status = 'running'
+            try:
+                errors = job.account_id.send_messages_bulk(
+                    [tuple(pair) for pair in job.recipient_messages or []],
+                    message_type=job.message_type,
+                    attachment=job.attachment_id or None,
+                    delay=job.delay_between_messages,
+                )
+            except Exception as e:
+                _logger.error('Error sending bulk message job %s: %s', job.id, e)
+                job.write({
+                    'status': 'failed',
+                    'error_message': str(e),
+                    'error_count': job.total_recipients,
+                    'completed_date': fields.Datetime.now(),
+                })
+                continue
+            
+            failed_errors = [error for error in errors if error]
+            error_count = len(failed_errors)
+            if error_count:
+                _logger.error(
+                    'Bulk message job %s: %s of %s messages failed, first error: %s',
+                    job.id, error_count, len(errors), failed_errors[0],
+                )
+            
+            job.write({
+                'status': 'completed',
+                'success_count': len(errors) - error_count,
+                'error_count': error_count,
+                'error_message': failed_errors[0] if error_count else False,
+                'completed_date': fields.Datetime.now(),
+            })
+
+    @api.model
+    def cron_process_bulk_jobs(self, batch_size=5):
+        """Cron job to send pending bulk message jobs"""
+        jobs = self.search([('status', '=', 'pending')], order='id', limit=batch_size)
+        jobs.process()
+        
+        # Reschedule right away while jobs are still waiting
+        if self.search_count([('status', '=', 'pending')]):
+            self.env.ref('whatsapp.ir_cron_whatsapp_process_bulk_jobs')._trigger()
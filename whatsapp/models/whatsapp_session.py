@@ -1,15 +1,27 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import SQL, create_index
+from odoo.tools.safe_eval import safe_eval, datetime as safe_datetime, json as safe_json
 import json
 import logging
+import re
 import uuid
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 _logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1024)
+def _compile_trigger(trigger_type, trigger_value, case_sensitive):
+    """Return the compiled pattern, or the keyword/command to compare, of a bot trigger"""
+    if trigger_type == 'pattern':
+        return re.compile(trigger_value, 0 if case_sensitive else re.IGNORECASE)
+    return trigger_value if case_sensitive else trigger_value.lower()
+
+
 class WhatsAppSession(models.Model):
     _name = 'whatsapp.session'
     _description = 'WhatsApp Session'
@@ -22,7 +34,7 @@ class WhatsAppSession(models.Model):
     # Session info
     start_time = fields.Datetime('Start Time', default=fields.Datetime.now, required=True)
     end_time = fields.Datetime('End Time')
-    duration = fields.Integer('Duration (seconds)', compute='_compute_duration', store=True)
+    duration = fields.Integer('Duration (seconds)', compute='_compute_duration')
     
     # Session data
     session_data = fields.Text('Session Data', help='Encrypted session data')
@@ -44,6 +56,10 @@ class WhatsAppSession(models.Model):
     # Company
     company_id = fields.Many2one('res.company', 'Company', related='account_id.company_id', store=True)
     
+    def init(self):
+        # Partial index for the expired session scan, only active sessions are looked up
+        create_index(self._cr, 'whatsapp_session_active_start_idx', self._table, ['start_time'], where="status = 'active'")
+    
     @api.depends('start_time', 'end_time')
     def _compute_duration(self):
         for session in self:
@@ -56,15 +72,18 @@ class WhatsAppSession(models.Model):
     def terminate_session(self):
         """Terminate session"""
         self.ensure_one()
-        
+        self.terminate_sessions()
+
+    def terminate_sessions(self):
+        """Terminate sessions with one write, disconnecting each account once"""
         self.write({
             'status': 'terminated',
             'end_time': fields.Datetime.now(),
         })
         
-        # Terminate associated WhatsApp client
-        if self.account_id:
-            self.account_id.action_disconnect()
+        # Terminate associated WhatsApp clients
+        for account in self.account_id:
+            account.action_disconnect()
 
     @api.model
     def cleanup_expired_sessions(self):
@@ -76,11 +95,10 @@ class WhatsAppSession(models.Model):
             ('start_time', '<', expired_threshold)
         ])
         
-        for session in expired_sessions:
-            session.write({
-                'status': 'expired',
-                'end_time': fields.Datetime.now(),
-            })
+        expired_sessions.write({
+            'status': 'expired',
+            'end_time': fields.Datetime.now(),
+        })
         
         return len(expired_sessions)
 
@@ -116,6 +134,14 @@ class WhatsAppNotification(models.Model):
     # Company
     company_id = fields.Many2one('res.company', 'Company', default=lambda self: self.env.company)
 
+    def init(self):
+        # Indexes for get_user_notifications, in the default newest-first order
+        create_index(self._cr, 'whatsapp_notification_user_date_idx', self._table, ['user_id', 'create_date DESC'])
+        create_index(
+            self._cr, 'whatsapp_notification_user_unread_idx', self._table,
+            ['user_id', 'create_date DESC'], where='NOT is_read',
+        )
+
     def mark_as_read(self):
         """Mark notification as read"""
         self.ensure_one()
@@ -152,7 +178,7 @@ class WhatsAppNotification(models.Model):
     @api.model
     def create_notification(self, user_id, title, message, notification_type='info', account_id=None, action_url=None, action_model=None, action_res_id=None):
         """Create notification"""
-        vals = {
+        return self.create_notifications([{
             'title': title,
             'message': message,
             'notification_type': notification_type,
@@ -161,23 +187,28 @@ class WhatsAppNotification(models.Model):
             'action_url': action_url,
             'action_model': action_model,
             'action_res_id': action_res_id,
-        }
-        
-        notification = self.create(vals)
-        
-        # Send bus notification
-        self.env['bus.bus']._sendone(
-            (self._cr.dbname, 'whatsapp.notification', user_id),
-            {
-                'type': 'whatsapp_notification',
-                'notification_id': notification.id,
-                'title': title,
-                'message': message,
-                'notification_type': notification_type,
-            }
-        )
-        
-        return notification
+        }])
+
+    @api.model
+    def create_notifications(self, vals_list):
+        """Create notifications for several users at once and broadcast them on the bus"""
+        notifications = self.create(vals_list)
+        
+        # Send bus notifications
+        for notification in notifications:
+            self.env['bus.bus']._sendone(
+                notification.user_id.partner_id,
+                'whatsapp.notification',
+                {
+                    'type': 'whatsapp_notification',
+                    'notification_id': notification.id,
+                    'title': notification.title,
+                    'message': notification.message,
+                    'notification_type': notification.notification_type,
+                }
+            )
+        
+        return notifications
 
     @api.model
     def get_user_notifications(self, user_id=None, unread_only=False):
@@ -238,36 +269,36 @@ class WhatsAppBot(models.Model):
     # Company
     company_id = fields.Many2one('res.company', 'Company', related='account_id.company_id', store=True)
 
-    def check_trigger(self, message):
-        """Check if message triggers this bot"""
+    def check_trigger(self, message, message_text_lower=None):
+        """Check if message triggers this bot
+
+        :param message_text_lower: lowercased message text, computed once by callers checking several bots
+        """
         self.ensure_one()
         
         if not self.active:
             return False
         
+        if self.trigger_type == 'all':
+            return True
+        
+        if not self.trigger_value:
+            return False
+        
         message_text = message.get('body', '').strip()
+        trigger = _compile_trigger(self.trigger_type, self.trigger_value, self.case_sensitive)
         
-        if self.trigger_type == 'keyword':
-            if self.case_sensitive:
-                return self.trigger_value in message_text
-            else:
-                return self.trigger_value.lower() in message_text.lower()
+        if self.trigger_type == 'pattern':
+            return bool(trigger.search(message_text))
         
-        elif self.trigger_type == 'pattern':
-            import re
-            pattern = self.trigger_value
-            flags = 0 if self.case_sensitive else re.IGNORECASE
-            return bool(re.search(pattern, message_text, flags))
+        if not self.case_sensitive:
+            message_text = message_text_lower if message_text_lower is not None else message_text.lower()
         
-        elif self.trigger_type == 'command':
-            command = self.trigger_value
-            if not self.case_sensitive:
-                command = command.lower()
-                message_text = message_text.lower()
-            return message_text.startswith(command)
+        if self.trigger_type == 'keyword':
+            return trigger in message_text
         
-        elif self.trigger_type == 'all':
-            return True
+        elif self.trigger_type == 'command':
+            return message_text.startswith(trigger)
         
         return False
 
@@ -279,8 +310,25 @@ class WhatsAppBot(models.Model):
             return None
         
         # Update statistics
-        self.trigger_count += 1
-        self.last_triggered = fields.Datetime.now()
+        self._record_triggers()
+        
+        return self._get_response(message)
+
+    def _record_triggers(self):
+        """Count a trigger on each bot, with one atomic UPDATE for the batch"""
+        if not self:
+            return
+        
+        self.flush_recordset(['trigger_count', 'last_triggered'])
+        self.env.cr.execute(SQL(
+            'UPDATE whatsapp_bot SET trigger_count = COALESCE(trigger_count, 0) + 1, last_triggered = %s WHERE id IN %s',
+            fields.Datetime.now(), tuple(self.ids),
+        ))
+        self.invalidate_recordset(['trigger_count', 'last_triggered'])
+
+    def _get_response(self, message, now_str=None):
+        """Generate the bot response to a message that triggered it"""
+        self.ensure_one()
         
         try:
             if self.response_type == 'text':
@@ -289,7 +337,7 @@ class WhatsAppBot(models.Model):
             elif self.response_type == 'template':
                 if self.template_id:
                     # Extract variables from message
-                    variables = self._extract_variables(message)
+                    variables = self._extract_variables(message, now_str)
                     return self.template_id.render_template(variables)
                 
             elif self.response_type == 'action':
@@ -301,18 +349,20 @@ class WhatsAppBot(models.Model):
         
         return None
 
-    def _extract_variables(self, message):
-        """Extract variables from message"""
+    def _extract_variables(self, message, now_str=None):
+        """Extract variables from message
+
+        :param now_str: formatted current time, computed once by callers handling several bots
+        """
         variables = {
             'sender_name': message.get('contact', {}).get('name', ''),
             'sender_phone': message.get('from', '').replace('@c.us', ''),
             'message_text': message.get('body', ''),
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'timestamp': now_str or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         }
         
         # Extract custom variables based on trigger pattern
         if self.trigger_type == 'pattern':
-            import re
             match = re.search(self.trigger_value, message.get('body', ''))
             if match:
                 variables.update(match.groupdict())
@@ -331,12 +381,12 @@ class WhatsAppBot(models.Model):
                 'account': self.account_id,
                 'bot': self,
                 'env': self.env,
-                'datetime': datetime,
-                'json': json,
+                'datetime': safe_datetime,
+                'json': safe_json,
             }
             
-            # Execute code
-            exec(self.action_code, context)
+            # Execute code in the sandbox, the context receives the variables it sets
+            safe_eval(self.action_code, context, mode='exec', nocopy=True, filename=f'<bot {self.id}>')
             
             # Return response if set
             return context.get('response')
@@ -374,17 +424,91 @@ class WhatsAppBot(models.Model):
             }
         }
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        bots = super(WhatsAppBot, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return bots
+
+    def write(self, vals):
+        result = super(WhatsAppBot, self).write(vals)
+        if {'active', 'account_id', 'trigger_type', 'trigger_value', 'case_sensitive'} & vals.keys():
+            self.env.registry.clear_cache()
+        return result
+
+    def unlink(self):
+        result = super(WhatsAppBot, self).unlink()
+        self.env.registry.clear_cache()
+        return result
+
     @api.model
-    def process_incoming_message(self, account_id, message):
-        """Process incoming message with all active bots"""
-        bots = self.search([
+    @tools.ormcache('account_id')
+    def _get_active_bot_ids(self, account_id):
+        """Return the ids of the account's active bots, cached until a bot is added, moved or toggled"""
+        return tuple(self.sudo().search([
             ('account_id', '=', account_id),
             ('active', '=', True)
-        ])
+        ]).ids)
+
+    @api.model
+    @tools.ormcache('account_id')
+    def _get_keyword_index(self, account_id):
+        """Return the account's keyword bots index
+
+        :return: tuple of (keywords, keyword_bot_ids, first_chars), keywords being
+            (keyword, case_sensitive, bot_ids) tuples so bots sharing a keyword are
+            checked with a single lookup, and first_chars the lowercased first
+            character of every keyword
+        """
+        bot_ids_by_keyword = {}
+        for bot in self.sudo().browse(self._get_active_bot_ids(account_id)):
+            if bot.trigger_type == 'keyword' and bot.trigger_value:
+                keyword = _compile_trigger('keyword', bot.trigger_value, bot.case_sensitive)
+                bot_ids_by_keyword.setdefault((keyword, bot.case_sensitive), []).append(bot.id)
+        keywords = tuple(
+            (keyword, case_sensitive, frozenset(bot_ids))
+            for (keyword, case_sensitive), bot_ids in bot_ids_by_keyword.items()
+        )
+        keyword_bot_ids = frozenset(bot_id for dummy, dummy, bot_ids in keywords for bot_id in bot_ids)
+        first_chars = frozenset(keyword[0].lower() for keyword, dummy, dummy in keywords)
+        return keywords, keyword_bot_ids, first_chars
+
+    @api.model
+    def process_incoming_message(self, account_id, message):
+        """Process incoming message with all active bots"""
+        active_bot_ids = self._get_active_bot_ids(account_id)
+        keywords, keyword_bot_ids, first_chars = self._get_keyword_index(account_id)
+        
+        # Keyword bots are matched from the keyword index, each distinct keyword once,
+        # skipped entirely when no keyword can start anywhere in the message
+        message_text = message.get('body', '').strip()
+        lowered_text = message_text.lower()
+        triggered_ids = set()
+        if not first_chars.isdisjoint(lowered_text):
+            for keyword, case_sensitive, bot_ids in keywords:
+                if keyword in (message_text if case_sensitive else lowered_text):
+                    triggered_ids |= bot_ids
+        
+        # Only keyword bots and none matched, nothing left to check
+        if not triggered_ids and keyword_bot_ids.issuperset(active_bot_ids):
+            return []
+        
+        bots = self.browse(active_bot_ids)
+        
+        # Count all triggered bots at once, then build their responses
+        triggered_bots = bots.filtered(
+            lambda bot: bot.id in triggered_ids if bot.id in keyword_bot_ids else bot.check_trigger(message, lowered_text)
+        )
+        triggered_bots._record_triggers()
+        
+        # Load what the responses need for all triggered bots in one query per model
+        triggered_bots.fetch(['name', 'response_type', 'response_text', 'template_id', 'action_code', 'account_id'])
+        triggered_bots.template_id.fetch(['content'])
         
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         responses = []
-        for bot in bots:
-            response = bot.process_message(message)
+        for bot in triggered_bots:
+            response = bot._get_response(message, now_str)
             if response:
                 responses.append({
                     'bot_id': bot.id,
@@ -456,15 +580,17 @@ class WhatsAppIntegration(models.Model):
     def _process_crm_integration(self, message):
         """Process CRM integration"""
         # Create lead from WhatsApp message
-        lead_vals = {
+        lead = self.env['crm.lead'].create(self._build_lead_vals(message))
+        return lead
+
+    def _build_lead_vals(self, message):
+        """Return the values of the lead created from a WhatsApp message"""
+        return {
             'name': f'WhatsApp Lead from {message.get("contact", {}).get("name", "Unknown")}',
             'phone': message.get('from', '').replace('@c.us', ''),
             'description': message.get('body', ''),
-            'source_id': self.env.ref('whatsapp.lead_source_whatsapp').id,
+            'source_id': self.env['crm.lead']._get_whatsapp_source_id(),
         }
-        
-        lead = self.env['crm.lead'].create(lead_vals)
-        return lead
 
     def _process_sale_integration(self, message):
         """Process Sales integration"""
@@ -2,11 +2,67 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import SQL, create_index
+import hmac
 import json
 import logging
+import re
+from functools import lru_cache
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 _logger = logging.getLogger(__name__)
 
+# Shared HTTP session so webhook deliveries reuse pooled keep-alive connections
+_webhook_session = requests.Session()
+_webhook_adapter = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=Retry(total=0))
+_webhook_session.mount('https://', _webhook_adapter)
+_webhook_session.mount('http://', _webhook_adapter)
+
+# Maps every ASCII character except letters and digits to an underscore
+_CODE_TRANSLATION = {char: '_' for char in range(128) if not chr(char).isalnum()}
+_TEMPLATE_VAR_RE = re.compile(r'\{\{(\w+)\}\}')
+
+# Attachment media type by MIME type prefix, anything else is a document
+_MEDIA_TYPE_BY_MIME_PREFIX = {
+    'image': 'image',
+    'video': 'video',
+    'audio': 'audio',
+}
+
+
+@lru_cache(maxsize=512)
+def _get_format_string(content):
+    """Convert template content to a str.format_map pattern
+
+    Literal braces are escaped and each {{name}} becomes {_name}; the prefix
+    keeps numeric placeholders from being parsed as positional fields.
+    """
+    parts = _TEMPLATE_VAR_RE.split(content)
+    parts[::2] = [text.replace('{', '{{').replace('}', '}}') for text in parts[::2]]
+    parts[1::2] = ['{_%s}' % name for name in parts[1::2]]
+    return ''.join(parts)
+
+
+class _TemplateValues(dict):
+    """format_map mapping that renders unknown placeholders back unchanged"""
+
+    def __missing__(self, key):
+        return '{{%s}}' % key[1:]
+
+
+def _post_webhook(url, body, headers, timeout):
+    """Post a webhook body, return the error message or False on success"""
+    try:
+        response = _webhook_session.post(url, data=body, headers=headers, timeout=timeout)
+    except Exception as e:
+        return str(e)
+    if response.status_code == 200:
+        return False
+    return f'HTTP {response.status_code}: {response.text}'
+
 
 class WhatsAppTemplate(models.Model):
     _name = 'whatsapp.template'
@@ -15,9 +71,9 @@ class WhatsAppTemplate(models.Model):
     _rec_name = 'name'
     _inherit = ['mail.thread', 'mail.activity.mixin']
 
-    name = fields.Char('Template Name', required=True, tracking=True)
-    code = fields.Char('Template Code', help='Unique code for API access')
-    description = fields.Text('Description')
+    name = fields.Char('Template Name', required=True, tracking=True, index='trigram')
+    code = fields.Char('Template Code', help='Unique code for API access', copy=False)
+    description = fields.Text('Description', index='trigram')
     
     # Template content
     template_type = fields.Selection([
@@ -31,7 +87,8 @@ class WhatsAppTemplate(models.Model):
     ], string='Template Type', default='text', required=True, tracking=True)
     
     content = fields.Text('Template Content', required=True, help='Template content with placeholders')
-    variables = fields.Text('Variables', help='JSON array of variable definitions')
+    variables = fields.Json('Variables', help='List of variable definitions')
+    variables_display = fields.Text('Variable Definitions', compute='_compute_variables_display')
     
     # Media template fields
     media_url = fields.Char('Media URL')
@@ -63,8 +120,8 @@ class WhatsAppTemplate(models.Model):
     is_public = fields.Boolean('Public Template', default=False, help='Available to all users')
     
     # Usage tracking
-    usage_count = fields.Integer('Usage Count', default=0, readonly=True)
-    last_used = fields.Datetime('Last Used', readonly=True)
+    usage_count = fields.Integer('Usage Count', default=0, readonly=True, copy=False)
+    last_used = fields.Datetime('Last Used', readonly=True, copy=False)
     
     # Relations
     account_id = fields.Many2one('whatsapp.account', 'WhatsApp Account', ondelete='cascade')
@@ -79,55 +136,63 @@ class WhatsAppTemplate(models.Model):
         ('unique_code', 'unique(code)', 'Template code must be unique!'),
     ]
 
-    @api.model
-    def create(self, vals):
+    def init(self):
+        # Partial indexes for get_public_templates and get_user_templates, in the default name order
+        create_index(self._cr, 'whatsapp_template_public_name_idx', self._table, ['name'], where='is_public AND active')
+        create_index(self._cr, 'whatsapp_template_user_name_idx', self._table, ['user_id', 'name'], where='active')
+
+    @api.model_create_multi
+    def create(self, vals_list):
         # Auto-generate code if not provided
-        if not vals.get('code'):
-            vals['code'] = self.env['ir.sequence'].next_by_code('whatsapp.template') or self._generate_code(vals.get('name', ''))
+        for vals in vals_list:
+            if not vals.get('code'):
+                vals['code'] = self.env['ir.sequence'].next_by_code('whatsapp.template') or self._generate_code(vals.get('name', ''))
         
-        return super(WhatsAppTemplate, self).create(vals)
+        return super(WhatsAppTemplate, self).create(vals_list)
 
     def _generate_code(self, name):
         """Generate unique code from name"""
-        import re
-        code = re.sub(r'[^a-zA-Z0-9]', '_', name.lower())
-        code = re.sub(r'_+', '_', code).strip('_')
+        # Non-ASCII characters become '?' first, which the table turns into '_'
+        code = name.lower().encode('ascii', 'replace').decode('ascii').translate(_CODE_TRANSLATION)
+        while '__' in code:
+            code = code.replace('__', '_')
+        code = code.strip('_')
         return code[:50]  # Limit length
 
+    @api.depends('variables')
+    def _compute_variables_display(self):
+        for template in self:
+            template.variables_display = json.dumps(template.variables, indent=2) if template.variables else False
+
     def get_variables(self):
         """Get template variables as list"""
         self.ensure_one()
-        if self.variables:
-            try:
-                return json.loads(self.variables)
-            except json.JSONDecodeError:
-                return []
-        return []
+        return self.variables or []
 
     def set_variables(self, variables):
         """Set template variables from list"""
         self.ensure_one()
-        self.variables = json.dumps(variables)
+        self.variables = variables
 
     def render_template(self, variables=None):
         """Render template with variables"""
         self.ensure_one()
         
         content = self.content
-        if variables:
-            for var_name, var_value in variables.items():
-                placeholder = f'{{{{{var_name}}}}}'
-                content = content.replace(placeholder, str(var_value))
-        
-        return content
+        # Plain-text templates need no substitution at all
+        if not variables or not content or '{{' not in content:
+            return content
+
+        # Substitution runs in C through format_map; unknown placeholders are kept as-is
+        values = _TemplateValues(('_%s' % name, value) for name, value in variables.items())
+        return _get_format_string(content).format_map(values)
 
     def validate_template(self):
         """Validate template content"""
         self.ensure_one()
         
         # Check for valid variables
-        import re
-        variables = re.findall(r'\{\{(\w+)\}\}', self.content)
+        variables = _TEMPLATE_VAR_RE.findall(self.content)
         template_vars = [var.get('name') for var in self.get_variables()]
         
         for var in variables:
@@ -177,8 +242,7 @@ class WhatsAppTemplate(models.Model):
         self.ensure_one()
         
         # Update usage statistics
-        self.usage_count += 1
-        self.last_used = fields.Datetime.now()
+        self._record_usage()
         
         return {
             'type': 'ir.actions.act_window',
@@ -193,16 +257,21 @@ class WhatsAppTemplate(models.Model):
             }
         }
 
+    def _record_usage(self):
+        """Count a use of each template, with one atomic UPDATE"""
+        self.flush_recordset(['usage_count', 'last_used'])
+        self.env.cr.execute(SQL(
+            'UPDATE whatsapp_template SET usage_count = COALESCE(usage_count, 0) + 1, last_used = %s WHERE id IN %s',
+            fields.Datetime.now(), tuple(self.ids),
+        ))
+        self.invalidate_recordset(['usage_count', 'last_used'])
+
     def action_duplicate(self):
         """Duplicate template"""
         self.ensure_one()
         
-        copy_vals = {
-            'name': _('%s (Copy)') % self.name,
-            'code': None,  # Will be auto-generated
-        }
-        
-        new_template = self.copy(copy_vals)
+        # Code and usage statistics are not copied, the code is auto-generated
+        new_template = self.copy({'name': _('%s (Copy)') % self.name})
         
         return {
             'type': 'ir.actions.act_window',
@@ -230,8 +299,8 @@ class WhatsAppTemplate(models.Model):
         ])
 
     @api.model
-    def search_templates(self, query, category_id=None, tag_ids=None):
-        """Search templates"""
+    def search_templates(self, query, category_id=None, tag_ids=None, within=None):
+        """Search templates, in memory among `within` when candidates are already loaded"""
         domain = [
             ('active', '=', True),
             '|',
@@ -245,6 +314,8 @@ class WhatsAppTemplate(models.Model):
         if tag_ids:
             domain.append(('tag_ids', 'in', tag_ids))
         
+        if within is not None:
+            return within.filtered_domain(domain)
         return self.search(domain)
 
 
@@ -267,8 +338,11 @@ class WhatsAppTemplateCategory(models.Model):
 
     @api.depends('template_ids')
     def _compute_template_count(self):
+        template_counts = dict(self.env['whatsapp.template']._read_group(
+            [('category_id', 'in', self.ids)], ['category_id'], ['__count']
+        ))
         for category in self:
-            category.template_count = len(category.template_ids)
+            category.template_count = template_counts.get(category, 0)
 
 
 class WhatsAppTemplateTag(models.Model):
@@ -303,7 +377,7 @@ class WhatsAppWebhook(models.Model):
     
     # Configuration
     active = fields.Boolean('Active', default=True, tracking=True)
-    events = fields.Char('Events', default='message,status,qr', help='Comma-separated list of events')
+    events = fields.Json('Events', default=lambda self: ['message', 'status', 'qr'], help='List of subscribed events')
     
     # Security
     verify_signature = fields.Boolean('Verify Signature', default=True)
@@ -314,7 +388,7 @@ class WhatsAppWebhook(models.Model):
     total_calls = fields.Integer('Total Calls', default=0, readonly=True)
     successful_calls = fields.Integer('Successful Calls', default=0, readonly=True)
     failed_calls = fields.Integer('Failed Calls', default=0, readonly=True)
-    last_call_date = fields.Datetime('Last Call Date', readonly=True)
+    last_call_date = fields.Datetime('Last Call Date', readonly=True, index=True)
     last_error = fields.Text('Last Error', readonly=True)
     
     # Company
@@ -325,8 +399,6 @@ class WhatsAppWebhook(models.Model):
         self.ensure_one()
         
         try:
-            import requests
-            
             test_data = {
                 'event': 'test',
                 'timestamp': fields.Datetime.now().isoformat(),
@@ -335,23 +407,16 @@ class WhatsAppWebhook(models.Model):
                 }
             }
             
+            # Serialize once: the signature must cover the exact bytes sent
+            body = json.dumps(test_data).encode('utf-8')
             headers = {'Content-Type': 'application/json'}
             if self.secret:
-                import hmac
-                import hashlib
-                import json
-                
-                payload = json.dumps(test_data).encode('utf-8')
-                signature = hmac.new(
-                    self.secret.encode('utf-8'),
-                    payload,
-                    hashlib.sha256
-                ).hexdigest()
+                signature = hmac.digest(self.secret.encode('utf-8'), body, 'sha256').hex()
                 headers['X-Hub-Signature-256'] = f'sha256={signature}'
             
-            response = requests.post(
+            response = _webhook_session.post(
                 self.url,
-                json=test_data,
+                data=body,
                 headers=headers,
                 timeout=self.timeout
             )
@@ -384,68 +449,79 @@ class WhatsAppWebhook(models.Model):
         if not self.active:
             return
         
+        # One timestamp for the payload and the statistics
+        now = fields.Datetime.now()
         try:
-            import requests
-            import json
-            
-            payload = {
-                'event': event,
-                'timestamp': fields.Datetime.now().isoformat(),
-                'account_id': self.account_id.id,
-                'data': data
-            }
-            
-            headers = {'Content-Type': 'application/json'}
-            if self.secret and self.verify_signature:
-                import hmac
-                import hashlib
-                
-                payload_str = json.dumps(payload).encode('utf-8')
-                signature = hmac.new(
-                    self.secret.encode('utf-8'),
-                    payload_str,
-                    hashlib.sha256
-                ).hexdigest()
-                headers['X-Hub-Signature-256'] = f'sha256={signature}'
-            
-            response = requests.post(
-                self.url,
-                json=payload,
-                headers=headers,
-                timeout=self.timeout
-            )
-            
-            # Update statistics
-            self.total_calls += 1
-            self.last_call_date = fields.Datetime.now()
-            
-            if response.status_code == 200:
-                self.successful_calls += 1
-                self.last_error = False
-                _logger.info(f'Webhook call successful: {self.url}')
-            else:
-                self.failed_calls += 1
-                error_msg = f'HTTP {response.status_code}: {response.text}'
-                self.last_error = error_msg
-                _logger.error(f'Webhook call failed: {error_msg}')
-        
+            body, headers = self._prepare_delivery(event, data, now.isoformat())
+            error_msg = _post_webhook(self.url, body, headers, self.timeout)
         except Exception as e:
-            self.failed_calls += 1
             error_msg = str(e)
-            self.last_error = error_msg
+        
+        # Update statistics
+        if error_msg:
+            self._record_call(False, error_msg, call_date=now)
             _logger.error(f'Webhook call failed: {error_msg}')
+        else:
+            self._record_call(True, call_date=now)
+            _logger.info(f'Webhook call successful: {self.url}')
+
+    def _prepare_delivery(self, event, data, timestamp):
+        """Return the encoded body and the headers of a webhook call"""
+        self.ensure_one()
+        payload = {
+            'event': event,
+            'timestamp': timestamp,
+            'account_id': self.account_id.id,
+            'data': data
+        }
+        
+        # Serialize once: the signature must cover the exact bytes sent
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.secret and self.verify_signature:
+            signature = hmac.digest(self.secret.encode('utf-8'), body, 'sha256').hex()
+            headers['X-Hub-Signature-256'] = f'sha256={signature}'
+        return body, headers
+
+    def _record_call(self, success, error=False, call_date=None):
+        """Update call statistics with one atomic UPDATE"""
+        self._record_calls({
+            webhook_id: (1, 0, False) if success else (0, 1, error)
+            for webhook_id in self.ids
+        }, call_date or fields.Datetime.now())
+
+    def _record_calls(self, stats, call_date):
+        """Add {webhook id: (successes, failures, last error)} to the call statistics"""
+        if not stats:
+            return
+        stat_fields = ['total_calls', 'successful_calls', 'failed_calls', 'last_call_date', 'last_error']
+        self.flush_recordset(stat_fields)
+        self.env.cr.execute(SQL(
+            """UPDATE whatsapp_webhook AS webhook
+               SET total_calls = COALESCE(webhook.total_calls, 0) + stats.successes + stats.failures,
+                   successful_calls = COALESCE(webhook.successful_calls, 0) + stats.successes,
+                   failed_calls = COALESCE(webhook.failed_calls, 0) + stats.failures,
+                   last_call_date = %s,
+                   last_error = stats.last_error
+               FROM (VALUES %s) AS stats(id, successes, failures, last_error)
+               WHERE webhook.id = stats.id""",
+            call_date,
+            SQL(', ').join(
+                SQL('(%s, %s, %s, %s::text)', webhook_id, successes, failures, error or None)
+                for webhook_id, (successes, failures, error) in stats.items()
+            ),
+        ))
+        self.invalidate_recordset(stat_fields)
 
     def get_events_list(self):
         """Get events as list"""
         self.ensure_one()
-        if self.events:
-            return [event.strip() for event in self.events.split(',')]
-        return []
+        return self.events or []
 
     def set_events_list(self, events):
         """Set events from list"""
         self.ensure_one()
-        self.events = ','.join(events)
+        self.events = list(events)
 
 
 class WhatsAppAttachment(models.Model):
@@ -493,26 +569,18 @@ class WhatsAppAttachment(models.Model):
     # Company
     company_id = fields.Many2one('res.company', 'Company', related='account_id.company_id', store=True)
 
-    @api.model
-    def create(self, vals):
-        attachment = super(WhatsAppAttachment, self).create(vals)
-        
-        # Auto-detect media type from MIME type
-        if not vals.get('media_type') and attachment.mime_type:
-            attachment.media_type = attachment._detect_media_type(attachment.mime_type)
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Auto-detect media type from MIME type before insert, no extra write needed
+        for vals in vals_list:
+            if not vals.get('media_type') and vals.get('mime_type'):
+                vals['media_type'] = self._detect_media_type(vals['mime_type'])
         
-        return attachment
+        return super(WhatsAppAttachment, self).create(vals_list)
 
     def _detect_media_type(self, mime_type):
         """Detect media type from MIME type"""
-        if mime_type.startswith('image/'):
-            return 'image'
-        elif mime_type.startswith('video/'):
-            return 'video'
-        elif mime_type.startswith('audio/'):
-            return 'audio'
-        else:
-            return 'document'
+        return _MEDIA_TYPE_BY_MIME_PREFIX.get(mime_type.split('/', 1)[0], 'document')
 
     def action_download(self):
         """Download attachment"""
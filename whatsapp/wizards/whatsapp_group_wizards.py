@@ -3,9 +3,37 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
 import logging
+import secrets
+from collections import namedtuple
 
 _logger = logging.getLogger(__name__)
 
+# Member to add to a group, as collected by the add-member wizard
+MemberData = namedtuple('MemberData', ['name', 'phone', 'contact_id', 'partner_id'])
+
+
+def _create_with_fallback(model, vals_list):
+    """Create records in one batch, falling back to one create per record on failure
+
+    Returns, for each values dict in order, the created record or the raised exception.
+    """
+    # Contacts created by a rolled back message create must not be reused
+    forget_cached_contacts = model.env['whatsapp.message']._forget_cached_contacts
+    try:
+        with model.env.cr.savepoint():
+            return list(model.create(vals_list))
+    except Exception:
+        forget_cached_contacts()
+        results = []
+        for vals in vals_list:
+            try:
+                with model.env.cr.savepoint():
+                    results.append(model.create(vals))
+            except Exception as e:
+                forget_cached_contacts()
+                results.append(e)
+        return results
+
 
 class WhatsAppGroupAddMember(models.TransientModel):
     _name = 'whatsapp.group.add.member'
@@ -90,7 +118,22 @@ class WhatsAppGroupAddMember(models.TransientModel):
         if not self.group_id.is_member:
             raise UserError(_('You must be a member of the group to add new members.'))
         
-        members_to_add = self._get_members_to_add()
+        # Cheap check on the selection before any lookup
+        selection = {
+            'contacts': self.contact_ids,
+            'numbers': self.phone_numbers and self.phone_numbers.strip(),
+            'partners': self.partner_ids,
+        }.get(self.add_method)
+        if not selection:
+            raise UserError(_('No members selected to add.'))
+        
+        # Keep the first entry of each phone number, the same number may be selected twice
+        members_to_add = []
+        seen_phones = set()
+        for member_data in self._get_members_to_add():
+            if member_data.phone not in seen_phones:
+                seen_phones.add(member_data.phone)
+                members_to_add.append(member_data)
         
         if not members_to_add:
             raise UserError(_('No members selected to add.'))
@@ -99,20 +142,17 @@ class WhatsAppGroupAddMember(models.TransientModel):
         error_count = 0
         results = []
         
-        for member_data in members_to_add:
-            try:
-                # Add member to group
-                result = self._add_member_to_group(member_data)
-                if result:
-                    success_count += 1
-                    results.append(f"✓ {member_data['name']} ({member_data['phone']}) added successfully")
-                else:
-                    error_count += 1
-                    results.append(f"✗ Failed to add {member_data['name']} ({member_data['phone']})")
-            except Exception as e:
+        for member_data, added, error in self._add_members_to_group(members_to_add):
+            if error:
+                error_count += 1
+                results.append(f"✗ Error adding {member_data.name}: {error}")
+                _logger.error(f"Error adding member {member_data.name} to group {self.group_id.name}: {error}")
+            elif added:
+                success_count += 1
+                results.append(f"✓ {member_data.name} ({member_data.phone}) added successfully")
+            else:
                 error_count += 1
-                results.append(f"✗ Error adding {member_data['name']}: {str(e)}")
-                _logger.error(f"Error adding member {member_data['name']} to group {self.group_id.name}: {e}")
+                results.append(f"✗ Failed to add {member_data.name} ({member_data.phone})")
         
         # Update results
         self.success_count = success_count
@@ -123,8 +163,8 @@ class WhatsAppGroupAddMember(models.TransientModel):
         if self.send_welcome_message and self.welcome_message:
             self._send_welcome_messages(members_to_add)
         
-        # Refresh group member count
-        self.group_id.action_sync_members()
+        # Refresh group member count in the background sync job
+        self.group_id._queue_member_sync()
         
         return self._show_results()
     
@@ -133,109 +173,160 @@ class WhatsAppGroupAddMember(models.TransientModel):
         members = []
         
         if self.add_method == 'contacts':
-            for contact in self.contact_ids:
-                members.append({
-                    'name': contact.name,
-                    'phone': contact.phone_number,
-                    'contact_id': contact.id,
-                    'partner_id': contact.partner_id.id if contact.partner_id else False,
-                })
+            # Read all selected contacts at once, as plain dicts
+            members = [
+                MemberData(
+                    name=contact['name'],
+                    phone=contact['phone_number'],
+                    contact_id=contact['id'],
+                    partner_id=contact['partner_id'][0] if contact['partner_id'] else False,
+                )
+                for contact in self.contact_ids.read(['name', 'phone_number', 'partner_id'])
+            ]
         
         elif self.add_method == 'numbers':
             if self.phone_numbers:
-                lines = self.phone_numbers.strip().split('\n')
-                for line in lines:
-                    phone = line.strip()
-                    if phone:
-                        # Try to find existing contact
-                        contact = self.env['whatsapp.contact'].search([
-                            ('phone_number', '=', phone),
-                            ('account_id', '=', self.account_id.id)
-                        ], limit=1)
-                        
-                        name = contact.name if contact else phone
-                        members.append({
-                            'name': name,
-                            'phone': phone,
-                            'contact_id': contact.id if contact else False,
-                            'partner_id': contact.partner_id.id if contact and contact.partner_id else False,
-                        })
+                phones = [line.strip() for line in self.phone_numbers.splitlines() if line.strip()]
+                
+                # Find existing contacts for all numbers in one query
+                contact_by_phone = {
+                    contact['phone_number']: contact
+                    for contact in self.env['whatsapp.contact'].search_read([
+                        ('phone_number', 'in', phones),
+                        ('account_id', '=', self.account_id.id)
+                    ], ['name', 'phone_number', 'partner_id'])
+                }
+                
+                for phone in phones:
+                    contact = contact_by_phone.get(phone)
+                    members.append(MemberData(
+                        name=contact['name'] if contact else phone,
+                        phone=phone,
+                        contact_id=contact['id'] if contact else False,
+                        partner_id=contact['partner_id'][0] if contact and contact['partner_id'] else False,
+                    ))
         
         elif self.add_method == 'partners':
-            for partner in self.partner_ids:
-                members.append({
-                    'name': partner.name,
-                    'phone': partner.whatsapp_number,
-                    'contact_id': False,
-                    'partner_id': partner.id,
-                })
+            members = [
+                MemberData(name=partner['name'], phone=partner['whatsapp_number'], contact_id=False, partner_id=partner['id'])
+                for partner in self.partner_ids.read(['name', 'whatsapp_number'])
+            ]
         
         return members
     
     def _add_member_to_group(self, member_data):
         """Add a single member to the group"""
-        try:
-            # Check if member already exists
-            existing_member = self.env['whatsapp.group.member'].search([
-                ('group_id', '=', self.group_id.id),
-                ('phone_number', '=', member_data['phone'])
-            ], limit=1)
-            
-            if existing_member:
-                if existing_member.status == 'active':
-                    return False  # Already a member
-                else:
-                    # Reactivate member
-                    existing_member.write({
+        member_data, added, error = self._add_members_to_group([member_data])[0]
+        if error:
+            raise UserError(error)
+        return added
+    
+    def _add_members_to_group(self, members):
+        """Add members to the group, creating the new ones in one batch
+
+        Returns a list of (member data, added, error message) in input order;
+        added is False for phone numbers that already are active members.
+        """
+        outcomes = [None] * len(members)
+        new_members = []
+        now = fields.Datetime.now()
+        group_id = self.group_id.id
+        is_admin = self.make_admin
+        GroupMember = self.env['whatsapp.group.member']
+        
+        # Existing members of the group for all incoming numbers, in one query
+        existing_by_phone = {
+            member['phone_number']: member
+            for member in GroupMember.search_read([
+                ('group_id', '=', group_id),
+                ('phone_number', 'in', [member_data.phone for member_data in members])
+            ], ['phone_number', 'status'])
+        }
+        
+        to_reactivate = []
+        for index, member_data in enumerate(members):
+            existing_member = existing_by_phone.get(member_data.phone)
+            if not existing_member:
+                new_members.append((index, member_data))
+            elif existing_member['status'] == 'active':
+                outcomes[index] = (member_data, False, False)  # Already a member
+            else:
+                to_reactivate.append((index, member_data, existing_member['id']))
+        
+        # Reactivate members with a single write
+        if to_reactivate:
+            try:
+                with self.env.cr.savepoint():
+                    GroupMember.browse(
+                        [member_id for index, member_data, member_id in to_reactivate]
+                    ).write({
                         'status': 'active',
-                        'is_admin': self.make_admin,
-                        'joined_at': fields.Datetime.now(),
+                        'is_admin': is_admin,
+                        'joined_date': now,
                     })
-                    return True
-            
-            # Create new member
-            member_vals = {
-                'group_id': self.group_id.id,
-                'name': member_data['name'],
-                'phone_number': member_data['phone'],
-                'contact_id': member_data['contact_id'],
-                'is_admin': self.make_admin,
-                'status': 'active',
-                'joined_at': fields.Datetime.now(),
-            }
-            
-            member = self.env['whatsapp.group.member'].create(member_vals)
-            
-            # Add member via WhatsApp API
-            self._add_member_via_api(member_data)
-            
-            return True
-            
-        except Exception as e:
-            _logger.error(f"Error adding member {member_data['name']} to group: {e}")
-            raise
+                reactivate_error = False
+            except Exception as e:
+                reactivate_error = str(e)
+            for index, member_data, member_id in to_reactivate:
+                outcomes[index] = (member_data, not reactivate_error, reactivate_error)
+        
+        # Create new members
+        member_vals_list = [{
+            'group_id': group_id,
+            'name': member_data.name,
+            'phone_number': member_data.phone,
+            'contact_id': member_data.contact_id,
+            'is_admin': is_admin,
+            'status': 'active',
+            'joined_date': now,
+        } for index, member_data in new_members]
+        created = _create_with_fallback(GroupMember, member_vals_list)
+        
+        added_members = []
+        for (index, member_data), member in zip(new_members, created):
+            if isinstance(member, Exception):
+                outcomes[index] = (member_data, False, str(member))
+            else:
+                added_members.append((index, member_data))
+        
+        # Add members via WhatsApp API, in one call for the batch
+        if added_members:
+            try:
+                self._add_members_via_api([member_data for index, member_data in added_members])
+                api_error = False
+            except Exception as e:
+                api_error = str(e)
+            for index, member_data in added_members:
+                outcomes[index] = (member_data, not api_error, api_error)
+        
+        return outcomes
     
     def _add_member_via_api(self, member_data):
         """Add member via WhatsApp API"""
+        return self._add_members_via_api([member_data])
+    
+    def _add_members_via_api(self, members):
+        """Add several members via WhatsApp API in one call"""
         try:
-            # Call WhatsApp API to add member
+            # Call WhatsApp API to add members
             account = self.group_id.account_id
             
             # This would call the actual WhatsApp API
             # For now, we'll just log the action
-            _logger.info(f"Adding member {member_data['name']} ({member_data['phone']}) to group {self.group_id.name}")
+            for member_data in members:
+                _logger.info("Adding member %s (%s) to group %s", member_data.name, member_data.phone, self.group_id.name)
             
             # TODO: Implement actual WhatsApp API call
-            # Example:
-            # response = account.call_whatsapp_api('addMember', {
+            # Example, one request for all participants:
+            # response = account.call_whatsapp_api('addParticipants', {
             #     'groupId': self.group_id.wa_group_id,
-            #     'participantId': member_data['phone'] + '@c.us'
+            #     'participants': [member_data.phone + '@c.us' for member_data in members]
             # })
             
             return True
             
         except Exception as e:
-            _logger.error(f"Error calling WhatsApp API to add member: {e}")
+            _logger.error(f"Error calling WhatsApp API to add members: {e}")
             raise
     
     def _send_welcome_messages(self, members):
@@ -243,29 +334,27 @@ class WhatsAppGroupAddMember(models.TransientModel):
         if not self.welcome_message:
             return
         
-        for member_data in members:
-            try:
-                # Send welcome message
-                message_vals = {
-                    'account_id': self.account_id.id,
-                    'group_id': self.group_id.id,
-                    'message': self.welcome_message,
-                    'message_type': 'text',
-                    'direction': 'outgoing',
-                    'to_number': member_data['phone'],
-                    'to_name': member_data['name'],
-                    'status': 'pending',
-                }
-                
-                # Create message record
-                message = self.env['whatsapp.message'].create(message_vals)
-                
+        message_vals_list = [{
+            'account_id': self.account_id.id,
+            'group_id': self.group_id.id,
+            'message': self.welcome_message,
+            'message_type': 'text',
+            'direction': 'outgoing',
+            'to_number': member_data.phone,
+            'to_name': member_data.name,
+            'status': 'pending',
+        } for member_data in members]
+        
+        # Create message records
+        messages = _create_with_fallback(self.env['whatsapp.message'], message_vals_list)
+        
+        for member_data, message in zip(members, messages):
+            if isinstance(message, Exception):
+                _logger.error(f"Error sending welcome message to {member_data.name}: {message}")
+            else:
                 # Send message via API
                 # TODO: Implement actual message sending
-                _logger.info(f"Sending welcome message to {member_data['name']}")
-                
-            except Exception as e:
-                _logger.error(f"Error sending welcome message to {member_data['name']}: {e}")
+                _logger.info("Sending welcome message to %s", member_data.name)
     
     def _show_results(self):
         """Show results of the operation"""
@@ -315,6 +404,7 @@ class WhatsAppGroupCreateGroup(models.TransientModel):
     
     @api.constrains('name')
     def _check_name(self):
+        """Validate the group name length"""
         for record in self:
             if len(record.name) < 3:
                 raise ValidationError(_('Group name must be at least 3 characters long.'))
@@ -343,7 +433,7 @@ class WhatsAppGroupCreateGroup(models.TransientModel):
                 'is_admin': True,
                 'is_owner': True,
                 'status': 'active',
-                'created_at': fields.Datetime.now(),
+                'created_date': fields.Datetime.now(),
             }
             
             group = self.env['whatsapp.group'].create(group_vals)
@@ -369,8 +459,7 @@ class WhatsAppGroupCreateGroup(models.TransientModel):
             
             # This would call the actual WhatsApp API
             # For now, we'll generate a mock group ID
-            import uuid
-            wa_group_id = f"group_{uuid.uuid4().hex[:8]}@g.us"
+            wa_group_id = f"group_{secrets.token_hex(4)}@g.us"
             
             _logger.info(f"Creating group {self.name} via WhatsApp API")
             
@@ -390,22 +479,24 @@ class WhatsAppGroupCreateGroup(models.TransientModel):
     
     def _add_initial_members(self, group):
         """Add initial members to the group"""
-        for contact in self.member_ids:
-            try:
-                member_vals = {
-                    'group_id': group.id,
-                    'name': contact.name,
-                    'phone_number': contact.phone_number,
-                    'contact_id': contact.id,
-                    'is_admin': self.make_members_admin,
-                    'status': 'active',
-                    'joined_at': fields.Datetime.now(),
-                }
-                
-                self.env['whatsapp.group.member'].create(member_vals)
-                
-            except Exception as e:
-                _logger.error(f"Error adding initial member {contact.name} to group: {e}")
+        now = fields.Datetime.now()
+        group_id = group.id
+        is_admin = self.make_members_admin
+        contacts = self.member_ids.read(['name', 'phone_number'])
+        member_vals_list = [{
+            'group_id': group_id,
+            'name': contact['name'],
+            'phone_number': contact['phone_number'],
+            'contact_id': contact['id'],
+            'is_admin': is_admin,
+            'status': 'active',
+            'joined_date': now,
+        } for contact in contacts]
+        
+        members = _create_with_fallback(self.env['whatsapp.group.member'], member_vals_list)
+        for contact, member in zip(contacts, members):
+            if isinstance(member, Exception):
+                _logger.error(f"Error adding initial member {contact['name']} to group: {member}")
     
     def _show_results(self):
         """Show results of the operation"""
@@ -2,13 +2,66 @@
 
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import split_every
 import csv
 import io
 import base64
+import json
 import logging
+import tempfile
+from collections import defaultdict
+from html import escape
+from itertools import groupby
 
 _logger = logging.getLogger(__name__)
 
+# Number of contacts written per savepoint during imports
+IMPORT_BATCH_SIZE = 500
+
+# Advisory lock namespace of contact syncs, the account id being the lock key
+CONTACT_SYNC_LOCK = 7382
+
+# Values of the "Is Business" CSV column read as true
+TRUE_LITERALS = frozenset({'true', '1', 'yes'})
+
+# Content of the downloadable contact import template
+CSV_TEMPLATE = (
+    b'Name,Phone,About,Is Business\r\n'
+    b'John Doe,+1234567890,Sample contact,false\r\n'
+    b'ABC Company,+1234567891,Business contact,true\r\n'
+)
+
+# Number of messages read per batch during exports
+EXPORT_BATCH_SIZE = 5000
+
+# Message fields read for exports
+EXPORT_MESSAGE_FIELDS = [
+    'timestamp', 'direction', 'from_number', 'from_name', 'to_number', 'to_name',
+    'message_type', 'message', 'status', 'wa_message_id', 'media_url',
+]
+
+# Extra message domain of each export message type filter
+MESSAGE_TYPE_DOMAINS = {
+    'text': [('message_type', '=', 'text')],
+    'media': [('message_type', '!=', 'text')],
+    'incoming': [('direction', '=', 'incoming')],
+    'outgoing': [('direction', '=', 'outgoing')],
+}
+
+# Markup of a message in the HTML export, filled with already escaped values
+HTML_MESSAGE_TEMPLATE = """
+            <div class="message {direction_class}">
+                <div><strong>{sender}</strong></div>
+                <div>{body}</div>
+                <div class="timestamp">{time}</div>
+            </div>
+            """
+
+
+def _message_day(message):
+    """Day of an exported message row, False when it has no timestamp"""
+    return message['timestamp'] and message['timestamp'].date()
+
 
 class WhatsAppImportContacts(models.TransientModel):
     _name = 'whatsapp.import.contacts'
@@ -65,7 +118,7 @@ class WhatsAppImportContacts(models.TransientModel):
                 return self._import_manual()
         
         except Exception as e:
-            _logger.error(f'Error importing contacts: {e}')
+            _logger.error('Error importing contacts: %s', e)
             raise UserError(_('Error importing contacts: %s') % str(e))
 
     def _sync_from_whatsapp(self):
@@ -75,6 +128,20 @@ class WhatsAppImportContacts(models.TransientModel):
         if self.account_id.status != 'ready':
             raise UserError(_('WhatsApp account is not ready.'))
         
+        # Concurrent syncs of an account would fetch the same contact list:
+        # when another transaction is already syncing it, don't start a second one
+        self.env.cr.execute('SELECT pg_try_advisory_xact_lock(%s, %s)', [CONTACT_SYNC_LOCK, self.account_id.id])
+        if not self.env.cr.fetchone()[0]:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'message': _('Contacts of this account are already being synced, they will be available shortly.'),
+                    'type': 'info',
+                    'next': {'type': 'ir.actions.act_window_close'},
+                }
+            }
+        
         try:
             # Sync contacts via account
             self.account_id.sync_contacts()
@@ -82,15 +149,19 @@ class WhatsAppImportContacts(models.TransientModel):
             # Count results
             total_contacts = len(self.account_id.contact_ids)
             
-            self.write({
-                'imported_count': total_contacts,
-                'import_log': _('Successfully synced %s contacts from WhatsApp') % total_contacts
-            })
-            
-            return self._show_results()
+            # A one-line result needs no results form: notify and close the wizard
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'message': _('Successfully synced %s contacts from WhatsApp') % total_contacts,
+                    'type': 'success',
+                    'next': {'type': 'ir.actions.act_window_close'},
+                }
+            }
         
         except Exception as e:
-            _logger.error(f'Error syncing contacts: {e}')
+            _logger.error('Error syncing contacts: %s', e)
             raise UserError(_('Error syncing contacts: %s') % str(e))
 
     def _import_from_csv(self):
@@ -101,83 +172,117 @@ class WhatsAppImportContacts(models.TransientModel):
             raise UserError(_('Please select a CSV file.'))
         
         try:
-            # Decode CSV file
-            csv_data = base64.b64decode(self.csv_file).decode('utf-8')
-            csv_reader = csv.DictReader(io.StringIO(csv_data), delimiter=self.csv_delimiter)
+            # Decode CSV file, parsing rows straight from the bytes
+            csv_text = io.TextIOWrapper(io.BytesIO(base64.b64decode(self.csv_file)), encoding='utf-8', newline='')
+            csv_reader = csv.reader(csv_text, delimiter=self.csv_delimiter)
+            
+            # Resolve the column positions once from the header
+            header = next(csv_reader, [])
+            name_idx, phone_idx, about_idx, business_idx = (
+                header.index(column) if column in header else None
+                for column in ('Name', 'Phone', 'About', 'Is Business')
+            )
+            
+            def cell(row, index):
+                return row[index] if index is not None and index < len(row) else ''
             
             imported_count = 0
             updated_count = 0
             skipped_count = 0
             error_count = 0
             log_lines = []
+            to_create = {}
+            to_update = {}
+            created_rows = {}
+            updated_rows = {}
             
-            for row_num, row in enumerate(csv_reader, 1):
+            format_phone = self.env['whatsapp.contact']._format_phone_number
+            rows = []
+            # Blank lines are not data rows
+            for row_num, row in enumerate(filter(None, csv_reader), 1):
                 try:
                     # Get contact data
-                    name = row.get('Name', '').strip()
-                    phone = row.get('Phone', '').strip()
+                    name = cell(row, name_idx).strip()
+                    phone = cell(row, phone_idx).strip()
                     
                     if not name or not phone:
-                        log_lines.append(f'Row {row_num}: Missing name or phone')
+                        log_lines.append((row_num, 'Missing name or phone'))
                         error_count += 1
                         continue
                     
-                    # Check if contact exists
-                    existing_contact = self.env['whatsapp.contact'].search([
-                        ('account_id', '=', self.account_id.id),
-                        ('phone_number', '=', phone)
-                    ], limit=1)
+                    # Normalize like whatsapp.contact stores it, so that differently
+                    # written copies of a number are recognized as duplicates
+                    phone = format_phone(phone)
                     
-                    if existing_contact:
-                        if self.skip_duplicates:
-                            log_lines.append(f'Row {row_num}: Skipped duplicate contact {name}')
-                            skipped_count += 1
-                            continue
-                        elif self.update_existing:
-                            existing_contact.write({
-                                'name': name,
-                                'about': row.get('About', ''),
-                                'is_business': row.get('Is Business', '').lower() == 'true',
-                            })
-                            log_lines.append(f'Row {row_num}: Updated contact {name}')
-                            updated_count += 1
-                            continue
-                    
-                    # Create new contact
-                    contact_vals = {
-                        'account_id': self.account_id.id,
+                    rows.append((row_num, phone, {
                         'name': name,
-                        'phone_number': phone,
-                        'about': row.get('About', ''),
-                        'is_business': row.get('Is Business', '').lower() == 'true',
-                    }
-                    
-                    contact = self.env['whatsapp.contact'].create(contact_vals)
-                    
-                    # Create partner if requested
-                    if self.create_partners:
-                        self._create_partner_for_contact(contact)
-                    
-                    log_lines.append(f'Row {row_num}: Imported contact {name}')
-                    imported_count += 1
+                        'about': cell(row, about_idx),
+                        'is_business': cell(row, business_idx).strip().lower() in TRUE_LITERALS,
+                    }))
                 
                 except Exception as e:
-                    log_lines.append(f'Row {row_num}: Error - {str(e)}')
+                    log_lines.append((row_num, 'Error - %s', e))
                     error_count += 1
             
+            existing_contacts = self._get_existing_contact_ids({phone for _row_num, phone, _vals in rows})
+            
+            for row_num, phone, contact_vals in rows:
+                name = contact_vals['name']
+                
+                # Check if contact exists, in the database or earlier in the file
+                existing_id = existing_contacts.get(phone)
+                
+                if existing_id or phone in to_create:
+                    if self.skip_duplicates:
+                        log_lines.append((row_num, 'Skipped duplicate contact %s', name))
+                        skipped_count += 1
+                        continue
+                    elif self.update_existing:
+                        if phone in to_create:
+                            # Repeated in the file: merge into the pending values
+                            to_create[phone].update(contact_vals)
+                            created_rows[phone].append((row_num, name))
+                        elif existing_id in to_update:
+                            to_update[existing_id].update(contact_vals)
+                            updated_rows[existing_id].append((row_num, name))
+                        else:
+                            to_update[existing_id] = contact_vals
+                            updated_rows[existing_id] = [(row_num, name)]
+                        continue
+                    elif phone in to_create:
+                        # Repeated in the file, keep the first row
+                        log_lines.append((row_num, 'Skipped duplicate contact %s', name))
+                        skipped_count += 1
+                        continue
+                
+                # Queue new contact
+                to_create[phone] = dict(contact_vals, account_id=self.account_id.id, phone_number=phone)
+                created_rows[phone] = [(row_num, name)]
+            
+            create_errors, update_errors = self._save_imported_contacts(to_create, to_update)
+            
+            # Log the rows once their batch is saved
+            created, merged, failed = self._log_saved_rows(created_rows, create_errors, 'Imported contact %s', log_lines)
+            imported_count += created
+            updated_count += merged
+            error_count += failed
+            updated, merged, failed = self._log_saved_rows(updated_rows, update_errors, 'Updated contact %s', log_lines)
+            updated_count += updated + merged
+            error_count += failed
+            
             # Update results
             self.write({
                 'imported_count': imported_count,
                 'updated_count': updated_count,
                 'skipped_count': skipped_count,
                 'error_count': error_count,
-                'import_log': '\n'.join(log_lines)
+                'import_log': self._format_import_log('Row', log_lines)
             })
             
             return self._show_results()
         
         except Exception as e:
-            _logger.error(f'Error importing from CSV: {e}')
+            _logger.error('Error importing from CSV: %s', e)
             raise UserError(_('Error importing from CSV: %s') % str(e))
 
     def _import_manual(self):
@@ -193,59 +298,75 @@ class WhatsAppImportContacts(models.TransientModel):
             skipped_count = 0
             error_count = 0
             log_lines = []
+            to_create = {}
+            to_update = {}
+            created_rows = {}
+            updated_rows = {}
             
+            format_phone = self.env['whatsapp.contact']._format_phone_number
+            entries = []
             for line_num, line in enumerate(self.manual_contacts.split('\n'), 1):
                 line = line.strip()
                 if not line:
                     continue
                 
-                try:
-                    # Parse line (Name, Phone)
-                    parts = [p.strip() for p in line.split(',')]
-                    if len(parts) < 2:
-                        log_lines.append(f'Line {line_num}: Invalid format. Expected: Name, Phone')
-                        error_count += 1
+                # Parse line (Name, Phone)
+                parts = [p.strip() for p in line.split(',')]
+                if len(parts) < 2:
+                    log_lines.append((line_num, 'Invalid format. Expected: Name, Phone'))
+                    error_count += 1
+                    continue
+                
+                # Phone normalized as in the CSV import
+                entries.append((line_num, parts[0], format_phone(parts[1])))
+            
+            existing_contacts = self._get_existing_contact_ids({phone for _line_num, _name, phone in entries})
+            
+            for line_num, name, phone in entries:
+                # Check if contact exists, in the database or earlier in the list
+                existing_id = existing_contacts.get(phone)
+                
+                if existing_id or phone in to_create:
+                    if self.skip_duplicates:
+                        log_lines.append((line_num, 'Skipped duplicate contact %s', name))
+                        skipped_count += 1
+                        continue
+                    elif self.update_existing:
+                        if phone in to_create:
+                            # Repeated in the list: merge into the pending values
+                            to_create[phone]['name'] = name
+                            created_rows[phone].append((line_num, name))
+                        elif existing_id in to_update:
+                            to_update[existing_id]['name'] = name
+                            updated_rows[existing_id].append((line_num, name))
+                        else:
+                            to_update[existing_id] = {'name': name}
+                            updated_rows[existing_id] = [(line_num, name)]
+                        continue
+                    elif phone in to_create:
+                        # Repeated in the list, keep the first line
+                        log_lines.append((line_num, 'Skipped duplicate contact %s', name))
+                        skipped_count += 1
                         continue
-                    
-                    name = parts[0]
-                    phone = parts[1]
-                    
-                    # Check if contact exists
-                    existing_contact = self.env['whatsapp.contact'].search([
-                        ('account_id', '=', self.account_id.id),
-                        ('phone_number', '=', phone)
-                    ], limit=1)
-                    
-                    if existing_contact:
-                        if self.skip_duplicates:
-                            log_lines.append(f'Line {line_num}: Skipped duplicate contact {name}')
-                            skipped_count += 1
-                            continue
-                        elif self.update_existing:
-                            existing_contact.write({'name': name})
-                            log_lines.append(f'Line {line_num}: Updated contact {name}')
-                            updated_count += 1
-                            continue
-                    
-                    # Create new contact
-                    contact_vals = {
-                        'account_id': self.account_id.id,
-                        'name': name,
-                        'phone_number': phone,
-                    }
-                    
-                    contact = self.env['whatsapp.contact'].create(contact_vals)
-                    
-                    # Create partner if requested
-                    if self.create_partners:
-                        self._create_partner_for_contact(contact)
-                    
-                    log_lines.append(f'Line {line_num}: Imported contact {name}')
-                    imported_count += 1
                 
-                except Exception as e:
-                    log_lines.append(f'Line {line_num}: Error - {str(e)}')
-                    error_count += 1
+                # Queue new contact
+                to_create[phone] = {
+                    'account_id': self.account_id.id,
+                    'name': name,
+                    'phone_number': phone,
+                }
+                created_rows[phone] = [(line_num, name)]
+            
+            create_errors, update_errors = self._save_imported_contacts(to_create, to_update)
+            
+            # Log the lines once their batch is saved
+            created, merged, failed = self._log_saved_rows(created_rows, create_errors, 'Imported contact %s', log_lines)
+            imported_count += created
+            updated_count += merged
+            error_count += failed
+            updated, merged, failed = self._log_saved_rows(updated_rows, update_errors, 'Updated contact %s', log_lines)
+            updated_count += updated + merged
+            error_count += failed
             
             # Update results
             self.write({
@@ -253,40 +374,140 @@ class WhatsAppImportContacts(models.TransientModel):
                 'updated_count': updated_count,
                 'skipped_count': skipped_count,
                 'error_count': error_count,
-                'import_log': '\n'.join(log_lines)
+                'import_log': self._format_import_log('Line', log_lines)
             })
             
             return self._show_results()
         
         except Exception as e:
-            _logger.error(f'Error importing manual contacts: {e}')
+            _logger.error('Error importing manual contacts: %s', e)
             raise UserError(_('Error importing manual contacts: %s') % str(e))
 
-    def _create_partner_for_contact(self, contact):
-        """Create partner for contact"""
+    @api.model
+    def _format_import_log(self, label, log_lines):
+        """Render the (line number, message, *args) log entries of an import, in line order"""
+        return '\n'.join(
+            '%s %d: %s' % (label, line_num, message % tuple(args))
+            for line_num, message, *args in sorted(log_lines, key=lambda entry: entry[0])
+        )
+
+    @api.model
+    def _log_saved_rows(self, rows_by_key, errors, message, log_lines):
+        """Log the rows saved into each imported contact, after the save
+
+        The first row of a contact is logged with ``message``, the rows merged
+        into it as updates; all rows of a contact that failed are errors.
+
+        :param rows_by_key: dict of key -> list of (line number, name) of the rows
+        :param errors: dict of key -> error of the contacts that failed
+        :return: tuple (saved count, merged count, error count)
+        """
+        saved_count = merged_count = error_count = 0
+        for key, rows in rows_by_key.items():
+            for index, (line_num, name) in enumerate(rows):
+                if key in errors:
+                    log_lines.append((line_num, 'Error - %s', errors[key]))
+                    error_count += 1
+                elif index:
+                    log_lines.append((line_num, 'Updated contact %s', name))
+                    merged_count += 1
+                else:
+                    log_lines.append((line_num, message, name))
+                    saved_count += 1
+        return saved_count, merged_count, error_count
+
+    def _get_existing_contact_ids(self, phones):
+        """Return a dict of phone number -> id of the account's existing contacts"""
+        if not phones:
+            return {}
+        contacts = self.env['whatsapp.contact'].search_read([
+            ('account_id', '=', self.account_id.id),
+            ('phone_number', 'in', list(phones))
+        ], ['phone_number'])
+        return {contact['phone_number']: contact['id'] for contact in contacts}
+
+    def _save_imported_contacts(self, to_create, to_update):
+        """Create and update the collected contacts in batch
+
+        Every batch runs in its own savepoint; a failing batch is retried
+        record by record, so that a bad row only fails itself.
+
+        :param to_create: dict of key -> values of the contacts to create
+        :param to_update: dict of contact id -> values to write
+        :return: tuple (create errors by key, update errors by contact id)
+        """
+        Contact = self.env['whatsapp.contact']
+        create_errors = {}
+        update_errors = {}
+        
+        # Contacts receiving identical values are written together
+        ids_by_vals = defaultdict(list)
+        for contact_id, vals in to_update.items():
+            ids_by_vals[tuple(sorted(vals.items()))].append(contact_id)
+        for vals, contact_ids in ids_by_vals.items():
+            for batch_ids in split_every(IMPORT_BATCH_SIZE, contact_ids, list):
+                try:
+                    with self.env.cr.savepoint():
+                        Contact.browse(batch_ids).write(dict(vals))
+                except Exception:
+                    for contact_id in batch_ids:
+                        try:
+                            with self.env.cr.savepoint():
+                                Contact.browse(contact_id).write(dict(vals))
+                        except Exception as e:
+                            update_errors[contact_id] = e
+        
+        contact_ids = []
+        for batch in split_every(IMPORT_BATCH_SIZE, to_create.items(), list):
+            try:
+                with self.env.cr.savepoint():
+                    contact_ids += Contact.create([vals for _key, vals in batch]).ids
+            except Exception:
+                for key, vals in batch:
+                    try:
+                        with self.env.cr.savepoint():
+                            contact_ids += Contact.create(vals).ids
+                    except Exception as e:
+                        create_errors[key] = e
+        
+        if self.create_partners and contact_ids:
+            self._create_partners_for_contacts(Contact.browse(contact_ids))
+        
+        return create_errors, update_errors
+
+    def _create_partners_for_contacts(self, contacts):
+        """Link imported contacts to partners, creating the missing ones in batch"""
+        # Contacts matching a partner were already linked on creation
+        contacts = contacts.filtered(lambda c: not c.partner_id)
+        if not contacts:
+            return
+        
+        # Look up the partners of all contacts in one query
+        partners = self.env['res.partner'].search_read([
+            ('phone', 'in', contacts.mapped('phone_number'))
+        ], ['phone'])
+        partner_ids = {}
+        for partner in partners:
+            partner_ids.setdefault(partner['phone'], partner['id'])
+        
+        new_contacts = contacts.filtered(lambda c: c.phone_number not in partner_ids)
         try:
-            # Check if partner already exists
-            existing_partner = self.env['res.partner'].search([
-                ('phone', '=', contact.phone_number)
-            ], limit=1)
-            
-            if existing_partner:
-                contact.partner_id = existing_partner.id
-            else:
-                partner_vals = {
+            with self.env.cr.savepoint():
+                new_partners = self.env['res.partner'].create([{
                     'name': contact.name,
                     'phone': contact.phone_number,
                     'whatsapp_number': contact.phone_number,
                     'is_company': contact.is_business,
                     'customer_rank': 1,
                     'supplier_rank': 0,
-                }
-                
-                partner = self.env['res.partner'].create(partner_vals)
-                contact.partner_id = partner.id
-        
+                } for contact in new_contacts])
+            partner_ids.update(zip(new_contacts.mapped('phone_number'), new_partners.ids))
         except Exception as e:
-            _logger.warning(f'Error creating partner for contact {contact.name}: {e}')
+            _logger.warning('Error creating partners for %s imported contacts: %s', len(new_contacts), e)
+        
+        for contact in contacts:
+            if contact.phone_number in partner_ids:
+                contact.partner_id = partner_ids[contact.phone_number]
 
     def _show_results(self):
         """Show import results"""
@@ -301,23 +522,11 @@ class WhatsAppImportContacts(models.TransientModel):
 
     def action_download_template(self):
         """Download CSV template"""
-        template_data = [
-            ['Name', 'Phone', 'About', 'Is Business'],
-            ['John Doe', '+1234567890', 'Sample contact', 'false'],
-            ['ABC Company', '+1234567891', 'Business contact', 'true'],
-        ]
-        
-        # Convert to CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerows(template_data)
-        csv_content = output.getvalue().encode('utf-8')
-        
         # Create attachment
         attachment = self.env['ir.attachment'].create({
             'name': 'whatsapp_contacts_template.csv',
             'type': 'binary',
-            'datas': base64.b64encode(csv_content),
+            'raw': CSV_TEMPLATE,
             'mimetype': 'text/csv',
         })
         
@@ -396,7 +605,7 @@ class WhatsAppExportMessages(models.TransientModel):
                 return self._export_txt(messages)
         
         except Exception as e:
-            _logger.error(f'Error exporting messages: {e}')
+            _logger.error('Error exporting messages: %s', e)
             raise UserError(_('Error exporting messages: %s') % str(e))
 
     def _get_messages(self):
@@ -416,23 +625,41 @@ class WhatsAppExportMessages(models.TransientModel):
             domain.append(('group_id', '=', self.group_id.id))
         
         # Filter by message type
-        if self.message_types == 'text':
-            domain.append(('message_type', '=', 'text'))
-        elif self.message_types == 'media':
-            domain.append(('message_type', '!=', 'text'))
-        elif self.message_types == 'incoming':
-            domain.append(('direction', '=', 'incoming'))
-        elif self.message_types == 'outgoing':
-            domain.append(('direction', '=', 'outgoing'))
+        domain += MESSAGE_TYPE_DOMAINS.get(self.message_types, [])
         
         return self.env['whatsapp.message'].search(domain, order='timestamp asc')
 
+    def _iter_message_rows(self, messages):
+        """Yield the exported fields of the messages as dicts, reading them batch by batch"""
+        for batch in split_every(EXPORT_BATCH_SIZE, messages.ids, self.env['whatsapp.message'].browse):
+            yield from batch.read(EXPORT_MESSAGE_FIELDS)
+            # Keep only one batch in the cache at a time
+            batch.invalidate_recordset()
+
+    def _export_attachment(self, output, extension, mimetype):
+        """Store the export written to ``output`` as an attachment and return its download action"""
+        output.flush()
+        export_file = output.buffer
+        export_file.seek(0)
+        
+        filename = f'whatsapp_messages_{self.account_id.name}_{self.date_from.strftime("%Y%m%d")}_{self.date_to.strftime("%Y%m%d")}.{extension}'
+        attachment = self.env['ir.attachment'].create({
+            'name': filename,
+            'type': 'binary',
+            'raw': export_file.read(),
+            'mimetype': mimetype,
+        })
+        
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'new',
+        }
+
     def _export_csv(self, messages):
         """Export messages as CSV"""
         self.ensure_one()
         
-        # Prepare CSV data
-        csv_data = []
         headers = ['Date', 'Time', 'Direction', 'From', 'To', 'Message Type', 'Message']
         
         if self.include_metadata:
@@ -441,114 +668,103 @@ class WhatsAppExportMessages(models.TransientModel):
         if self.include_media:
             headers.append('Media URL')
         
-        csv_data.append(headers)
-        
-        for message in messages:
-            row = [
-                message.timestamp.strftime('%Y-%m-%d') if message.timestamp else '',
-                message.timestamp.strftime('%H:%M:%S') if message.timestamp else '',
-                message.direction,
-                message.from_name or message.from_number,
-                message.to_name or message.to_number,
-                message.message_type,
-                message.message or '',
-            ]
+        # Stream the rows to a temporary file
+        with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as output:
+            writer = csv.writer(output)
+            writer.writerow(headers)
             
-            if self.include_metadata:
-                row.extend([
-                    message.status,
-                    message.wa_message_id or '',
-                ])
-            
-            if self.include_media:
-                row.append(message.media_url or '')
+            # Messages come in timestamp order: the date string only changes with the day
+            current_day = date_str = None
+            for message in self._iter_message_rows(messages):
+                timestamp = message['timestamp']
+                if timestamp:
+                    if timestamp.date() != current_day:
+                        current_day = timestamp.date()
+                        date_str = current_day.isoformat()
+                    row_date = date_str
+                    row_time = f'{timestamp.hour:02d}:{timestamp.minute:02d}:{timestamp.second:02d}'
+                else:
+                    row_date = row_time = ''
+                
+                row = [
+                    row_date,
+                    row_time,
+                    message['direction'],
+                    message['from_name'] or message['from_number'],
+                    message['to_name'] or message['to_number'],
+                    message['message_type'],
+                    message['message'] or '',
+                ]
+                
+                if self.include_metadata:
+                    row.extend([
+                        message['status'],
+                        message['wa_message_id'] or '',
+                    ])
+                
+                if self.include_media:
+                    row.append(message['media_url'] or '')
+                
+                writer.writerow(row)
             
-            csv_data.append(row)
-        
-        # Convert to CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerows(csv_data)
-        csv_content = output.getvalue().encode('utf-8')
-        
-        # Create attachment
-        filename = f'whatsapp_messages_{self.account_id.name}_{self.date_from.strftime("%Y%m%d")}_{self.date_to.strftime("%Y%m%d")}.csv'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(csv_content),
-            'mimetype': 'text/csv',
-        })
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'new',
-        }
+            return self._export_attachment(output, 'csv', 'text/csv')
 
     def _export_json(self, messages):
         """Export messages as JSON"""
         self.ensure_one()
         
-        # Prepare JSON data
-        json_data = {
+        header = {
             'account': self.account_id.name,
             'export_date': fields.Datetime.now().isoformat(),
             'date_from': self.date_from.isoformat(),
             'date_to': self.date_to.isoformat(),
             'total_messages': len(messages),
-            'messages': []
         }
         
-        for message in messages:
-            msg_data = {
-                'timestamp': message.timestamp.isoformat() if message.timestamp else None,
-                'direction': message.direction,
-                'from_number': message.from_number,
-                'from_name': message.from_name,
-                'to_number': message.to_number,
-                'to_name': message.to_name,
-                'message_type': message.message_type,
-                'message': message.message,
-            }
+        # Stream the messages to a temporary file, one JSON object per line:
+        # without indent, json.dumps uses the C encoder
+        with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as output:
+            output.write(json.dumps(header, indent=2)[:-2])
+            output.write(',\n  "messages": [')
             
-            if self.include_metadata:
-                msg_data.update({
-                    'status': message.status,
-                    'wa_message_id': message.wa_message_id,
-                    'message_id': message.id,
-                })
+            separator = '\n    '
+            for message in self._iter_message_rows(messages):
+                msg_data = {
+                    'timestamp': message['timestamp'].isoformat() if message['timestamp'] else None,
+                    'direction': message['direction'],
+                    'from_number': message['from_number'],
+                    'from_name': message['from_name'],
+                    'to_number': message['to_number'],
+                    'to_name': message['to_name'],
+                    'message_type': message['message_type'],
+                    'message': message['message'],
+                }
+                
+                if self.include_metadata:
+                    msg_data.update({
+                        'status': message['status'],
+                        'wa_message_id': message['wa_message_id'],
+                        'message_id': message['id'],
+                    })
+                
+                if self.include_media and message['media_url']:
+                    msg_data['media_url'] = message['media_url']
+                
+                output.write(separator)
+                output.write(json.dumps(msg_data))
+                separator = ',\n    '
             
-            if self.include_media and message.media_url:
-                msg_data['media_url'] = message.media_url
+            output.write('\n  ]\n}')
             
-            json_data['messages'].append(msg_data)
-        
-        # Convert to JSON
-        import json
-        json_content = json.dumps(json_data, indent=2).encode('utf-8')
-        
-        # Create attachment
-        filename = f'whatsapp_messages_{self.account_id.name}_{self.date_from.strftime("%Y%m%d")}_{self.date_to.strftime("%Y%m%d")}.json'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(json_content),
-            'mimetype': 'application/json',
-        })
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'new',
-        }
+            return self._export_attachment(output, 'json', 'application/json')
 
     def _export_html(self, messages):
         """Export messages as HTML"""
         self.ensure_one()
         
-        # Generate HTML content
-        html_content = f"""
+        with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as output:
+            # Generate HTML content
+            output.write(f"""
         <!DOCTYPE html>
         <html>
         <head>
@@ -565,59 +781,44 @@ class WhatsAppExportMessages(models.TransientModel):
         </head>
         <body>
             <div class="header">
-                <h1>WhatsApp Messages - {self.account_id.name}</h1>
+                <h1>WhatsApp Messages - {escape(self.account_id.name)}</h1>
                 <p>Export Date: {fields.Datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
                 <p>Period: {self.date_from.strftime('%Y-%m-%d')} to {self.date_to.strftime('%Y-%m-%d')}</p>
             </div>
-        """
-        
-        current_date = None
-        for message in messages:
-            msg_date = message.timestamp.strftime('%Y-%m-%d') if message.timestamp else 'Unknown'
+        """)
             
-            # Add date separator if date changed
-            if current_date != msg_date:
-                html_content += f'<div style="text-align: center; margin: 20px 0; font-weight: bold;">{msg_date}</div>'
-                current_date = msg_date
-            
-            # Add message
-            direction_class = 'incoming' if message.direction == 'incoming' else 'outgoing'
-            sender = message.from_name or message.from_number
+            for day, day_messages in groupby(self._iter_message_rows(messages), key=_message_day):
+                # Date separator
+                msg_date = day.isoformat() if day else 'Unknown'
+                output.write(f'<div style="text-align: center; margin: 20px 0; font-weight: bold;">{msg_date}</div>')
+                
+                for message in day_messages:
+                    timestamp = message['timestamp']
+                    direction_class = 'incoming' if message['direction'] == 'incoming' else 'outgoing'
+                    sender = message['from_name'] or message['from_number']
+                    time_str = f'{timestamp.hour:02d}:{timestamp.minute:02d}:{timestamp.second:02d}' if timestamp else 'Unknown time'
+                    
+                    output.write(HTML_MESSAGE_TEMPLATE.format_map({
+                        'direction_class': direction_class,
+                        'sender': escape(sender or ''),
+                        'body': escape(message['message']) if message['message'] else '<i>Media message</i>',
+                        'time': time_str,
+                    }))
             
-            html_content += f"""
-            <div class="message {direction_class}">
-                <div><strong>{sender}</strong></div>
-                <div>{message.message or '<i>Media message</i>'}</div>
-                <div class="timestamp">{message.timestamp.strftime('%H:%M:%S') if message.timestamp else 'Unknown time'}</div>
-            </div>
-            """
-        
-        html_content += """
+            output.write("""
         </body>
         </html>
-        """
-        
-        # Create attachment
-        filename = f'whatsapp_messages_{self.account_id.name}_{self.date_from.strftime("%Y%m%d")}_{self.date_to.strftime("%Y%m%d")}.html'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(html_content.encode('utf-8')),
-            'mimetype': 'text/html',
-        })
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'new',
-        }
+        """)
+            
+            return self._export_attachment(output, 'html', 'text/html')
 
     def _export_txt(self, messages):
         """Export messages as plain text"""
         self.ensure_one()
         
-        # Generate text content
-        txt_content = f"""WhatsApp Messages Export
+        with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as output:
+            # Generate text content
+            output.write(f"""WhatsApp Messages Export
 Account: {self.account_id.name}
 Export Date: {fields.Datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 Period: {self.date_from.strftime('%Y-%m-%d')} to {self.date_to.strftime('%Y-%m-%d')}
@@ -625,35 +826,19 @@ Total Messages: {len(messages)}
 
 {'='*50}
 
-"""
-        
-        current_date = None
-        for message in messages:
-            msg_date = message.timestamp.strftime('%Y-%m-%d') if message.timestamp else 'Unknown'
-            
-            # Add date separator if date changed
-            if current_date != msg_date:
-                txt_content += f'\n--- {msg_date} ---\n\n'
-                current_date = msg_date
+""")
             
-            # Add message
-            sender = message.from_name or message.from_number
-            time_str = message.timestamp.strftime('%H:%M:%S') if message.timestamp else 'Unknown time'
-            direction_arrow = '<-' if message.direction == 'incoming' else '->'
+            for day, day_messages in groupby(self._iter_message_rows(messages), key=_message_day):
+                # Date separator
+                msg_date = day.isoformat() if day else 'Unknown'
+                output.write(f'\n--- {msg_date} ---\n\n')
+                
+                for message in day_messages:
+                    timestamp = message['timestamp']
+                    sender = message['from_name'] or message['from_number']
+                    time_str = f'{timestamp.hour:02d}:{timestamp.minute:02d}:{timestamp.second:02d}' if timestamp else 'Unknown time'
+                    direction_arrow = '<-' if message['direction'] == 'incoming' else '->'
+                    
+                    output.write(f'[{time_str}] {sender} {direction_arrow} {message["message"] or "[Media message]"}\n')
             
-            txt_content += f'[{time_str}] {sender} {direction_arrow} {message.message or "[Media message]"}\n'
-        
-        # Create attachment
-        filename = f'whatsapp_messages_{self.account_id.name}_{self.date_from.strftime("%Y%m%d")}_{self.date_to.strftime("%Y%m%d")}.txt'
-        attachment = self.env['ir.attachment'].create({
-            'name': filename,
-            'type': 'binary',
-            'datas': base64.b64encode(txt_content.encode('utf-8')),
-            'mimetype': 'text/plain',
-        })
-        
-        return {
-            'type': 'ir.actions.act_url',
-            'url': f'/web/content/{attachment.id}?download=true',
-            'target': 'new',
-        }
\ No newline at end of file
+            return self._export_attachment(output, 'txt', 'text/plain')
@@ -3,10 +3,37 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import ValidationError, UserError
 import base64
+import json
 import logging
+import re
 
 _logger = logging.getLogger(__name__)
 
+# Placeholders replaced when personalizing bulk messages
+_PLACEHOLDER_RE = re.compile(r'\{\{(name|number|email|company)\}\}')
+
+# Bulk recipient numbers, once formatted to international format
+_PHONE_RE = re.compile(r'^\+?\d{7,15}$')
+
+# Wizard relations copied onto the sent message
+_MESSAGE_RELATIONS = (
+    'partner_id', 'contact_id', 'group_id', 'lead_id', 'sale_order_id',
+    'reply_to_message_id', 'forward_from_message_id',
+)
+
+# Estimated cost per bulk message, by message type
+_DEFAULT_MESSAGE_COST = 0.05
+_MESSAGE_COSTS = {
+    'text': _DEFAULT_MESSAGE_COST,
+    'image': 0.08,
+    'document': 0.06,
+}
+
+
+def _parse_manual_numbers(manual_numbers):
+    """Return the numbers of a manual bulk recipient list, one per non-blank line"""
+    return tuple(number for number in (line.strip() for line in manual_numbers.splitlines()) if number)
+
 
 class WhatsAppSendMessage(models.TransientModel):
     _name = 'whatsapp.send.message'
@@ -30,7 +57,7 @@ class WhatsAppSendMessage(models.TransientModel):
     
     # Template
     template_id = fields.Many2one('whatsapp.template', 'Template')
-    template_variables = fields.Text('Template Variables', help='JSON variables for template')
+    template_variables = fields.Text('Template Variables', help='JSON variables for template', prefetch=False)
     
     # Media attachment
     attachment_id = fields.Many2one('ir.attachment', 'Attachment')
@@ -41,12 +68,12 @@ class WhatsAppSendMessage(models.TransientModel):
     latitude = fields.Float('Latitude')
     longitude = fields.Float('Longitude')
     location_name = fields.Char('Location Name')
-    location_address = fields.Text('Location Address')
+    location_address = fields.Text('Location Address', prefetch=False)
     
     # Contact data
     contact_name = fields.Char('Contact Name')
     contact_phone = fields.Char('Contact Phone')
-    contact_vcard = fields.Text('Contact VCard')
+    contact_vcard = fields.Text('Contact VCard', prefetch=False)
     
     # Relations
     partner_id = fields.Many2one('res.partner', 'Partner')
@@ -72,7 +99,7 @@ class WhatsAppSendMessage(models.TransientModel):
         res = super(WhatsAppSendMessage, self).default_get(fields)
         
         # Set default account
-        if not res.get('account_id'):
+        if 'account_id' in fields and not res.get('account_id'):
             default_account = self.env['whatsapp.account'].search([
                 ('status', '=', 'ready'),
                 ('active', '=', True)
@@ -83,8 +110,9 @@ class WhatsAppSendMessage(models.TransientModel):
         # Set recipient from context
         if self.env.context.get('default_partner_id'):
             partner = self.env['res.partner'].browse(self.env.context['default_partner_id'])
-            if partner.whatsapp_number:
-                res['to_number'] = partner.whatsapp_number
+            whatsapp_number = partner.read(['whatsapp_number'])[0]['whatsapp_number']
+            if whatsapp_number:
+                res['to_number'] = whatsapp_number
         
         return res
 
@@ -102,7 +130,6 @@ class WhatsAppSendMessage(models.TransientModel):
                 variables[var_name] = var_default
             
             if variables:
-                import json
                 self.template_variables = json.dumps(variables)
 
     @api.onchange('message_type')
@@ -110,42 +137,40 @@ class WhatsAppSendMessage(models.TransientModel):
         if self.message_type != 'text':
             self.template_id = False
 
-    @api.onchange('media_file')
-    def _onchange_media_file(self):
+    def _get_media_attachment(self):
+        """Return the attachment to send, creating one from the uploaded file"""
+        self.ensure_one()
         if self.media_file and self.media_filename:
-            # Create attachment
-            attachment_vals = {
+            # Decode the upload once and store the raw bytes
+            return self.env['ir.attachment'].create({
                 'name': self.media_filename,
-                'datas': self.media_file,
-                'res_model': 'whatsapp.send.message',
+                'raw': base64.b64decode(self.media_file),
+                'res_model': self._name,
                 'res_id': self.id,
-            }
-            
-            # Delete existing attachment
-            if self.attachment_id:
-                self.attachment_id.unlink()
-            
-            # Create new attachment
-            attachment = self.env['ir.attachment'].create(attachment_vals)
-            self.attachment_id = attachment.id
+            })
+        return self.attachment_id
+
+    def _get_rendered_content(self):
+        """Return the message content, rendered from the template if one is used"""
+        self.ensure_one()
+        
+        if not self.template_id:
+            return self.message
+        
+        variables = {}
+        if self.template_variables:
+            try:
+                variables = json.loads(self.template_variables)
+            except json.JSONDecodeError:
+                pass
+        
+        return self.template_id.render_template(variables)
 
     def action_preview(self):
         """Preview message before sending"""
         self.ensure_one()
         
-        # Render template if using template
-        if self.template_id:
-            variables = {}
-            if self.template_variables:
-                try:
-                    import json
-                    variables = json.loads(self.template_variables)
-                except json.JSONDecodeError:
-                    pass
-            
-            preview_message = self.template_id.render_template(variables)
-        else:
-            preview_message = self.message
+        preview_message = self._get_rendered_content()
         
         return {
             'type': 'ir.actions.act_window',
@@ -178,19 +203,7 @@ class WhatsAppSendMessage(models.TransientModel):
             raise UserError(_('Message content is required.'))
         
         # Prepare message content
-        message_content = self.message
-        
-        # Render template if using template
-        if self.template_id:
-            variables = {}
-            if self.template_variables:
-                try:
-                    import json
-                    variables = json.loads(self.template_variables)
-                except json.JSONDecodeError:
-                    pass
-            
-            message_content = self.template_id.render_template(variables)
+        message_content = self._get_rendered_content()
         
         try:
             # Send message
@@ -219,37 +232,24 @@ class WhatsAppSendMessage(models.TransientModel):
         """Send message immediately"""
         self.ensure_one()
         
+        message_type = self.message_type
+        
         # Prepare attachment
         attachment = None
-        if self.attachment_id and self.message_type in ['image', 'video', 'audio', 'document']:
-            attachment = self.attachment_id
+        if message_type in ('image', 'video', 'audio', 'document'):
+            attachment = self._get_media_attachment() or None
         
         # Send message via account
         result = self.account_id.send_message(
             to=self.to_number,
             message=message_content,
-            message_type=self.message_type,
+            message_type=message_type,
             attachment=attachment
         )
         
         # Update relations
         if result:
-            update_vals = {}
-            if self.partner_id:
-                update_vals['partner_id'] = self.partner_id.id
-            if self.contact_id:
-                update_vals['contact_id'] = self.contact_id.id
-            if self.group_id:
-                update_vals['group_id'] = self.group_id.id
-            if self.lead_id:
-                update_vals['lead_id'] = self.lead_id.id
-            if self.sale_order_id:
-                update_vals['sale_order_id'] = self.sale_order_id.id
-            if self.reply_to_message_id:
-                update_vals['reply_to_message_id'] = self.reply_to_message_id.id
-            if self.forward_from_message_id:
-                update_vals['forward_from_message_id'] = self.forward_from_message_id.id
-            
+            update_vals = {field: self[field].id for field in _MESSAGE_RELATIONS if self[field]}
             if update_vals:
                 result.write(update_vals)
         
@@ -273,7 +273,7 @@ class WhatsAppSendMessage(models.TransientModel):
             'lead_id': self.lead_id.id if self.lead_id else False,
             'sale_order_id': self.sale_order_id.id if self.sale_order_id else False,
             'template_id': self.template_id.id if self.template_id else False,
-            'attachment_id': self.attachment_id.id if self.attachment_id else False,
+            'attachment_id': self._get_media_attachment().id,
         }
         
         scheduled_message = self.env['whatsapp.scheduled.message'].create(scheduled_vals)
@@ -336,7 +336,7 @@ class WhatsAppBulkMessage(models.TransientModel):
     partner_ids = fields.Many2many('res.partner', string='Partners')
     contact_ids = fields.Many2many('whatsapp.contact', string='WhatsApp Contacts')
     lead_ids = fields.Many2many('crm.lead', string='CRM Leads')
-    manual_numbers = fields.Text('Manual Numbers', help='One number per line')
+    manual_numbers = fields.Text('Manual Numbers', help='One number per line', prefetch=False)
     
     # Message content
     message = fields.Text('Message', required=True)
@@ -379,7 +379,7 @@ class WhatsAppBulkMessage(models.TransientModel):
                 count = len(record.lead_ids)
             elif record.recipient_type == 'manual':
                 if record.manual_numbers:
-                    count = len([n.strip() for n in record.manual_numbers.split('\n') if n.strip()])
+                    count = len(_parse_manual_numbers(record.manual_numbers))
             
             record.total_recipients = count
 
@@ -387,12 +387,7 @@ class WhatsAppBulkMessage(models.TransientModel):
     def _compute_estimated_cost(self):
         for record in self:
             # Estimate cost based on message type and count
-            base_cost = 0.05  # Base cost per message
-            if record.message_type == 'image':
-                base_cost = 0.08
-            elif record.message_type == 'document':
-                base_cost = 0.06
-            
+            base_cost = _MESSAGE_COSTS.get(record.message_type, _DEFAULT_MESSAGE_COST)
             record.estimated_cost = record.total_recipients * base_cost
 
     @api.onchange('template_id')
@@ -444,7 +439,27 @@ class WhatsAppBulkMessage(models.TransientModel):
                 self._schedule_bulk_message()
             else:
                 # Send immediately
-                self._send_bulk_message_now()
+                bulk_job = self._send_bulk_message_now()
+                if bulk_job.status == 'failed':
+                    # Report the failure without raising, so the failed job is kept
+                    return {
+                        'type': 'ir.actions.client',
+                        'tag': 'display_notification',
+                        'params': {
+                            'message': _('Error sending bulk messages: %s') % bulk_job.error_message,
+                            'type': 'danger',
+                            'sticky': True,
+                        }
+                    }
+                if bulk_job.status == 'pending':
+                    return {
+                        'type': 'ir.actions.client',
+                        'tag': 'display_notification',
+                        'params': {
+                            'message': _('Bulk messages are being sent in the background'),
+                            'type': 'success',
+                        }
+                    }
             
             return {
                 'type': 'ir.actions.client',
@@ -465,50 +480,62 @@ class WhatsAppBulkMessage(models.TransientModel):
         
         recipients = []
         
+        # Read only the used fields, in one query per model
         if self.recipient_type == 'partners':
-            for partner in self.partner_ids:
-                number = partner.whatsapp_number or partner.phone or partner.mobile
+            partners = self.partner_ids.read(['whatsapp_number', 'phone', 'mobile', 'name', 'email', 'company_name'])
+            for partner in partners:
+                number = partner['whatsapp_number'] or partner['phone'] or partner['mobile']
                 if number:
                     recipients.append({
                         'number': number,
-                        'name': partner.name,
-                        'record_id': partner.id,
+                        'name': partner['name'],
+                        'record_id': partner['id'],
                         'model': 'res.partner',
+                        'email': partner['email'] or '',
+                        'company': partner['company_name'] or '',
                     })
         
         elif self.recipient_type == 'contacts':
-            for contact in self.contact_ids:
+            for contact in self.contact_ids.read(['phone_number', 'name']):
                 recipients.append({
-                    'number': contact.phone_number,
-                    'name': contact.name,
-                    'record_id': contact.id,
+                    'number': contact['phone_number'],
+                    'name': contact['name'],
+                    'record_id': contact['id'],
                     'model': 'whatsapp.contact',
                 })
         
         elif self.recipient_type == 'leads':
-            for lead in self.lead_ids:
-                number = lead.whatsapp_number or lead.phone or lead.mobile
+            for lead in self.lead_ids.read(['whatsapp_number', 'phone', 'mobile', 'name']):
+                number = lead['whatsapp_number'] or lead['phone'] or lead['mobile']
                 if number:
                     recipients.append({
                         'number': number,
-                        'name': lead.name,
-                        'record_id': lead.id,
+                        'name': lead['name'],
+                        'record_id': lead['id'],
                         'model': 'crm.lead',
                     })
         
         elif self.recipient_type == 'manual':
             if self.manual_numbers:
-                for line in self.manual_numbers.split('\n'):
-                    number = line.strip()
-                    if number:
-                        recipients.append({
-                            'number': number,
-                            'name': number,
-                            'record_id': None,
-                            'model': None,
-                        })
-        
-        return recipients
+                for number in _parse_manual_numbers(self.manual_numbers):
+                    recipients.append({
+                        'number': number,
+                        'name': number,
+                        'record_id': None,
+                        'model': None,
+                    })
+        
+        # Drop numbers that can't be valid and recipients listed twice, before anything is sent
+        format_phone_number = self.env['whatsapp.contact']._format_phone_number
+        seen_numbers = set()
+        valid_recipients = []
+        for recipient in recipients:
+            number = format_phone_number(recipient['number'])
+            if number and _PHONE_RE.match(number) and number not in seen_numbers:
+                seen_numbers.add(number)
+                valid_recipients.append(recipient)
+        
+        return valid_recipients
 
     def _get_sample_recipients(self):
         """Get sample recipients for preview"""
@@ -520,76 +547,51 @@ class WhatsAppBulkMessage(models.TransientModel):
         self.ensure_one()
         
         recipients = self._get_recipients()
+        if not recipients:
+            raise UserError(_('None of the selected recipients has a valid WhatsApp number.'))
+        
+        # Personalized messages are prepared here, while recipient data is at hand;
+        # a message without placeholders is the same for every recipient
+        message = self.message
+        if self.personalize_message and '{{' in message:
+            messages = [
+                (recipient['number'], self._personalize_message(message, recipient))
+                for recipient in recipients
+            ]
+        else:
+            messages = [(recipient['number'], message) for recipient in recipients]
         
-        # Create bulk message job
+        # Create bulk message job, sent in the background
         bulk_job = self.env['whatsapp.bulk.message.job'].create({
             'account_id': self.account_id.id,
-            'message': self.message,
+            'message': message,
             'message_type': self.message_type,
-            'template_id': self.template_id.id if self.template_id else False,
-            'attachment_id': self.attachment_id.id if self.attachment_id else False,
+            'template_id': self.template_id.id,
+            'attachment_id': self.attachment_id.id,
+            'recipient_messages': messages,
             'total_recipients': len(recipients),
             'delay_between_messages': self.delay_between_messages,
             'personalize_message': self.personalize_message,
-            'status': 'running',
-        })
-        
-        # Send messages
-        success_count = 0
-        error_count = 0
-        
-        for recipient in recipients:
-            try:
-                # Personalize message if enabled
-                message_content = self.message
-                if self.personalize_message:
-                    message_content = self._personalize_message(message_content, recipient)
-                
-                # Send message
-                result = self.account_id.send_message(
-                    to=recipient['number'],
-                    message=message_content,
-                    message_type=self.message_type,
-                    attachment=self.attachment_id if self.attachment_id else None
-                )
-                
-                if result:
-                    success_count += 1
-                else:
-                    error_count += 1
-                
-                # Add delay between messages
-                if self.delay_between_messages > 0:
-                    import time
-                    time.sleep(self.delay_between_messages)
-            
-            except Exception as e:
-                _logger.error(f'Error sending message to {recipient["number"]}: {e}')
-                error_count += 1
-        
-        # Update bulk job
-        bulk_job.write({
-            'status': 'completed',
-            'success_count': success_count,
-            'error_count': error_count,
-            'completed_date': fields.Datetime.now(),
+            'status': 'pending',
         })
+        bulk_job._queue()
         
         return bulk_job
 
     def _personalize_message(self, message, recipient):
         """Personalize message for recipient"""
-        # Replace placeholders
-        message = message.replace('{{name}}', recipient['name'])
-        message = message.replace('{{number}}', recipient['number'])
+        values = {
+            'name': recipient['name'],
+            'number': recipient['number'],
+        }
         
-        # Add more personalization based on model
+        # Add more personalization based on model, partner data is read by _get_recipients
         if recipient['model'] == 'res.partner' and recipient['record_id']:
-            partner = self.env['res.partner'].browse(recipient['record_id'])
-            message = message.replace('{{email}}', partner.email or '')
-            message = message.replace('{{company}}', partner.company_name or '')
+            values['email'] = recipient['email']
+            values['company'] = recipient['company']
         
-        return message
+        # Replace all placeholders in one pass, unknown ones are kept
+        return _PLACEHOLDER_RE.sub(lambda match: values.get(match[1], match[0]), message)
 
     def _schedule_bulk_message(self):
         """Schedule bulk message for later sending"""
@@ -622,10 +624,19 @@ class WhatsAppBulkMessage(models.TransientModel):
         }
 
     def _serialize_recipients(self):
-        """Serialize recipients for storage"""
-        recipients = self._get_recipients()
-        import json
-        return json.dumps(recipients)
+        """Serialize recipients for storage
+
+        Only the record ids and manual numbers are stored, names and numbers
+        are read again from the records when the message is sent.
+        """
+        self.ensure_one()
+        return json.dumps({
+            'type': self.recipient_type,
+            'partner_ids': self.partner_ids.ids,
+            'contact_ids': self.contact_ids.ids,
+            'lead_ids': self.lead_ids.ids,
+            'manual': list(_parse_manual_numbers(self.manual_numbers or '')),
+        })
 
 
 class WhatsAppAccountSetup(models.TransientModel):